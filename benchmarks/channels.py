@@ -0,0 +1,54 @@
+"""
+Compare parsing a channel lineup into a full tree of dicts against
+streaming it into Channel records, in time and peak memory.
+
+Usage: python benchmarks/channels.py [--lineups 100,1000,5000]
+"""
+import argparse
+import tracemalloc
+from controku.controku import _ChannelParser
+from controku.testing import FakeRoku
+from time import perf_counter
+from xml.etree import ElementTree
+
+def full_tree(xml: bytes) -> list:
+    tree = ElementTree.fromstring(xml)
+    channels = []
+    for channel in tree:
+        channels.append({"name": channel.findtext('name'), "number": channel.findtext('number'), "type": channel.findtext('type'), "channel": channel.findtext('physical-channel'), "hidden": channel.findtext('user-hidden'), "favorite": channel.findtext('user-favorite')})
+    return channels
+
+def streamed(xml: bytes) -> list:
+    parser = _ChannelParser()
+    channels = []
+    for start in range(0, len(xml), 8192):
+        channels += parser.feed(xml[start:start + 8192])
+    return channels + parser.close()
+
+def measure(function, xml: bytes, repeat: int) -> tuple:
+    start = perf_counter()
+    for _ in range(repeat):
+        function(xml)
+    elapsed = (perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    function(xml)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lineups", default="100,1000,5000", help="comma-separated channel lineup sizes")
+    args = parser.parse_args()
+
+    print("channels  tree (ms)  tree peak (KiB)  streamed (ms)  streamed peak (KiB)")
+    for lineup in [int(lineup) for lineup in args.lineups.split(",")]:
+        xml = FakeRoku(channels=lineup).tv_channels().encode()
+        repeat = max(1, 20000 // lineup)
+        tree_time, tree_peak = measure(full_tree, xml, repeat)
+        stream_time, stream_peak = measure(streamed, xml, repeat)
+        print(f"{lineup:8d}  {tree_time * 1000:9.3f}  {tree_peak / 1024:15.0f}  {stream_time * 1000:13.3f}  {stream_peak / 1024:19.0f}")
+
+if __name__ == "__main__":
+    main()
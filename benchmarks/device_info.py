@@ -0,0 +1,67 @@
+"""
+Compare the cost of parsing device-info with one findtext scan per field
+against the single-pass DeviceInfo parser.
+
+Real devices report many more tags than the simulated one, so the
+document is padded with extra tags to a realistic size.
+
+Usage: python benchmarks/device_info.py [--extra 60] [--repeat 20000]
+"""
+import argparse
+from controku import DeviceInfo
+from controku.testing import FakeRoku
+from time import perf_counter
+from xml.etree import ElementTree
+
+def findtext(ip: str, tree: ElementTree.Element) -> dict:
+    # how get_device used to parse device-info
+    device = {}
+    device['name'] = tree.findtext('user-device-name')
+    device['ip'] = ip
+    device['location'] = tree.findtext('user-device-location')
+    match tree.findtext('power-mode'):
+        case "Ready":
+            device['power'] = False
+        case "PowerOn":
+            device['power'] = True
+    device['model'] = tree.findtext('friendly-model-name')
+    device['serial'] = tree.findtext('serial-number')
+    device['udn'] = tree.findtext('udn')
+    device['resolution'] = tree.findtext('ui-resolution')
+    device['mac'] = tree.findtext('wifi-mac')
+    device['software'] = tree.findtext('software-version')
+    device['tv'] = tree.findtext('is-tv') == "true"
+    device['stick'] = tree.findtext('is-stick') == "true"
+    device['devmode'] = tree.findtext('developer-enabled') == "true"
+    device['netsound'] = tree.findtext('supports-private-listening') == "true"
+    device['headphones'] = tree.findtext('headphones-connected') == "true"
+    return device
+
+def document(extra: int) -> bytes:
+    xml = FakeRoku().device_info()
+    padding = "".join(f"<extra-field-{i}>value {i}</extra-field-{i}>" for i in range(extra))
+    # put the padding first, like the many tags real devices list before power-mode and friends
+    return xml.replace("<device-info>", "<device-info>" + padding, 1).encode()
+
+def measure(function, repeat: int) -> float:
+    start = perf_counter()
+    for _ in range(repeat):
+        function()
+    return (perf_counter() - start) / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--extra", type=int, default=60, help="number of extra tags in the document")
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    body = document(args.extra)
+    tree = ElementTree.fromstring(body)
+
+    print(f"XML parse:           {measure(lambda: ElementTree.fromstring(body), args.repeat):7.2f} us")
+    print(f"findtext per field:  {measure(lambda: findtext('127.0.0.1', tree), args.repeat):7.2f} us")
+    print(f"DeviceInfo:          {measure(lambda: DeviceInfo.from_element('127.0.0.1', tree), args.repeat):7.2f} us")
+    print(f"DeviceInfo as dict:  {measure(lambda: DeviceInfo.from_element('127.0.0.1', tree).as_dict(), args.repeat):7.2f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Compare keypress throughput of one-shot requests against a RokuClient.
+
+Usage: python benchmarks/keypress.py <ip> [--key KEY] [--count N]
+"""
+import argparse
+import requests
+from controku import RokuClient
+from time import perf_counter
+
+def one_shot(ip: str, key: str, count: int) -> float:
+    start = perf_counter()
+    for _ in range(count):
+        requests.post(f"http://{ip}:8060/keypress/{key}")
+    return count / (perf_counter() - start)
+
+def pooled(ip: str, key: str, count: int) -> float:
+    with RokuClient(ip) as client:
+        start = perf_counter()
+        for _ in range(count):
+            client.send_key(key)
+        return count / (perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("ip")
+    parser.add_argument("--key", default="Info")
+    parser.add_argument("--count", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"one-shot requests: {one_shot(args.ip, args.key, args.count):8.1f} keys/s")
+    print(f"RokuClient:        {pooled(args.ip, args.key, args.count):8.1f} keys/s")
+
+if __name__ == "__main__":
+    main()
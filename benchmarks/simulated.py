@@ -0,0 +1,67 @@
+"""
+Benchmark controku against simulated devices from controku.testing.
+
+Measures discovery time and keypress throughput as the number of devices
+grows, and the cost of parsing the channel lineup as it grows.
+
+Usage: python benchmarks/simulated.py [--devices 1,10,50] [--lineups 10,100,1000]
+"""
+import argparse
+import controku
+from controku.controku import _ChannelParser
+from controku.fleet import broadcast
+from controku.testing import FakeNetwork, FakeRoku
+from time import perf_counter
+
+def discovery(count: int, subnet: str) -> float:
+    with FakeNetwork(count, subnet=subnet):
+        start = perf_counter()
+        last = start
+        found = 0
+        for device in controku.iter_devices(timeout=10):
+            if device['ip'].startswith(subnet + "."):
+                found += 1
+                last = perf_counter()
+                if found == count:
+                    break
+
+        return last - start
+
+def keypresses(count: int, subnet: str, keys: int) -> float:
+    with FakeNetwork(count, subnet=subnet, ssdp=False) as network:
+        start = perf_counter()
+        broadcast(network.ips, "send_keys", ["Up"] * keys)
+        return count * keys / (perf_counter() - start)
+
+def parse(lineup: int, repeat: int) -> float:
+    xml = FakeRoku(channels=lineup).tv_channels().encode()
+    start = perf_counter()
+    for _ in range(repeat):
+        parser = _ChannelParser()
+        parser.feed(xml)
+        parser.close()
+    return (perf_counter() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", default="1,10,50", help="comma-separated device counts")
+    parser.add_argument("--lineups", default="10,100,1000", help="comma-separated channel lineup sizes")
+    parser.add_argument("--keys", type=int, default=50, help="keypresses sent to each device")
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.devices.split(",")]
+    lineups = [int(lineup) for lineup in args.lineups.split(",")]
+
+    print("devices  discovery (s)  keypresses/s")
+    for i, count in enumerate(counts):
+        found = discovery(count, f"127.0.{100 + i}")
+        throughput = keypresses(count, f"127.0.{150 + i}", args.keys)
+        print(f"{count:7d}  {found:13.3f}  {throughput:12.0f}")
+
+    print()
+    print("channels  parse (ms)")
+    for lineup in lineups:
+        print(f"{lineup:8d}  {parse(lineup, max(1, 10000 // lineup)) * 1000:10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Measure how long it takes to start the command line interface, compared
+with importing controku's heavy dependencies up front.
+
+Usage: python benchmarks/startup.py [--runs N]
+"""
+import argparse
+import subprocess
+import sys
+from statistics import median
+from time import perf_counter
+
+CASES = {
+    "python": "pass",
+    "import requests, ssdpy": "import requests, ssdpy",
+    "import controku": "import controku",
+    "controku-cli --help": "import sys; sys.argv = ['controku-cli', '--help']; from controku.cli import main; main()",
+    "import controku + RokuClient": "import controku; controku.RokuClient('127.0.0.1')",
+}
+
+def run(code: str, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run([sys.executable, "-c", code], stdout=subprocess.DEVNULL, check=False)
+        times.append(perf_counter() - start)
+    return median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    for name, code in CASES.items():
+        print(f"{name:30s} {run(code, args.runs) * 1000:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
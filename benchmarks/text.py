@@ -0,0 +1,51 @@
+"""
+Measure how fast text can be typed into a Roku device's on-screen keyboard,
+one request per character against send_text over one connection.
+
+Runs against a simulated device from controku.testing unless an IP address is given.
+
+Usage: python benchmarks/text.py [ip] [--text TEXT] [--repeat N]
+"""
+import argparse
+import controku
+import requests
+from controku.testing import FakeRoku
+from time import perf_counter
+
+def one_shot(ip: str, text: str, repeat: int) -> float:
+    keys = controku.text_keys(text)
+    start = perf_counter()
+    for _ in range(repeat):
+        for key in keys:
+            requests.post(f"http://{ip}:8060/keypress/{key}")
+        for _ in keys:
+            requests.post(f"http://{ip}:8060/keypress/Backspace")
+    return 2 * len(keys) * repeat / (perf_counter() - start)
+
+def buffered(ip: str, text: str, repeat: int) -> float:
+    start = perf_counter()
+    for _ in range(repeat):
+        controku.send_text(ip, text)
+        controku.send_text(ip, "", sent=text)
+    return 2 * len(text) * repeat / (perf_counter() - start)
+
+def run(ip: str, text: str, repeat: int):
+    print(f"one request per key: {one_shot(ip, text, repeat):8.1f} chars/s")
+    print(f"send_text:           {buffered(ip, text, repeat):8.1f} chars/s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("ip", nargs="?")
+    parser.add_argument("--text", default="The quick brown fox jumps over the lazy dog")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.ip is not None:
+        run(args.ip, args.text, args.repeat)
+        return
+
+    with FakeRoku("127.0.0.1") as device:
+        run(device.ip, args.text, args.repeat)
+
+if __name__ == "__main__":
+    main()
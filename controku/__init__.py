@@ -1 +1,4 @@
 from controku.controku import *
+from controku.macro import *
+from controku.channels import *
+from controku.apps import *
@@ -0,0 +1,3 @@
+from controku.cli import main
+
+main()
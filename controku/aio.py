@@ -0,0 +1,289 @@
+"""
+Asynchronous versions of the functions in controku.controku, built on aiohttp.
+
+Every call shares one connection pool per event loop, so a single loop can
+drive hundreds of devices at once. Responses are parsed by the same code as
+the synchronous functions, and the device-info cache is shared with them too.
+"""
+import asyncio
+import random
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+from controku.controku import DEFAULT_TIMEOUT, RETRIES, RETRY_DELAY, Channel, DeviceInfo, _ChannelParser, _check_tv, _run_request_hooks, _parse_active_tv_channel, _parse_device, _parse_media_player, _power_key, _search_query, circuit_breaker, device_info_cache
+from ssdpy import SSDPClient
+from time import perf_counter
+from typing import AsyncIterator, Optional
+from urllib.parse import urlparse
+from xml.etree import ElementTree
+
+# Limits of the shared connection pool, in total and per device
+POOL_LIMIT = 512
+POOL_LIMIT_PER_DEVICE = 4
+
+_session = None
+_session_loop = None
+
+def _timeout(timeout) -> ClientTimeout:
+    if isinstance(timeout, tuple):
+        return ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+
+    return ClientTimeout(total=timeout)
+
+def get_session() -> ClientSession:
+    """
+    Get the connection pool shared by every function in this module,
+    creating it for the running event loop if needed.
+
+    :return: The shared aiohttp session.
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = TCPConnector(limit=POOL_LIMIT, limit_per_host=POOL_LIMIT_PER_DEVICE)
+        _session = ClientSession(connector=connector, timeout=_timeout(DEFAULT_TIMEOUT))
+        _session_loop = loop
+
+    return _session
+
+async def close():
+    """
+    Close the shared connection pool.
+    """
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+async def request(ip: str, method: str, path: str, timeout=None, retries: Optional[int] = None) -> bytes:
+    """
+    Send a request to a Roku device. Like :meth:`controku.RokuClient.request`,
+    it uses the shared circuit breaker and retries failed GETs.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param method: HTTP method, either "GET" or "POST".
+    :type method: str
+
+    :param path: Path of the ECP endpoint, e.g. "/query/device-info".
+    :type path: str
+
+    :param timeout: Timeout for this request, overriding the default.
+    :type timeout: Optional[float | tuple]
+
+    :param retries: Number of times to retry if the request fails. Defaults
+                    to RETRIES for GETs and 0 for POSTs.
+    :type retries: Optional[int]
+
+    :return: The body of the response.
+    """
+    options = {} if timeout is None else {"timeout": _timeout(timeout)}
+    if retries is None:
+        retries = RETRIES if method == "GET" else 0
+
+    circuit_breaker.check(ip)
+    attempt = 0
+    while True:
+        start = perf_counter()
+        try:
+            async with get_session().request(method, f"http://{ip}:8060{path}", **options) as response:
+                content = await response.read()
+            break
+        except (ClientError, asyncio.TimeoutError) as e:
+            _run_request_hooks(ip, method, path, perf_counter() - start, 0, e)
+            if attempt >= retries:
+                circuit_breaker.failure(ip)
+                raise ConnectionError(f"Couldn't connect to Roku device at {ip}.") from e
+
+        await asyncio.sleep(random.uniform(0, RETRY_DELAY * 2 ** attempt))
+        attempt += 1
+
+    circuit_breaker.success(ip)
+    _run_request_hooks(ip, method, path, perf_counter() - start, len(content), None)
+    return content
+
+async def query(ip: str, path: str, timeout=None) -> ElementTree.Element:
+    """
+    Run a query on a Roku device and parse the XML it returns.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param path: Path of the query endpoint, e.g. "/query/device-info".
+    :type path: str
+
+    :param timeout: Timeout for this request, overriding the default.
+    :type timeout: Optional[float | tuple]
+
+    :return: The root element of the response.
+    """
+    return ElementTree.fromstring(await request(ip, "GET", path, timeout))
+
+async def device_info(ip: str, cached: bool = True, timeout=None) -> ElementTree.Element:
+    """
+    Get a Roku device's device-info, from the shared cache if possible.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param cached: Whether a cached copy may be used. The fetched document is cached either way.
+    :type cached: bool
+
+    :param timeout: Timeout for the request, overriding the default.
+    :type timeout: Optional[float | tuple]
+
+    :return: The root element of the device-info document.
+    """
+    if cached:
+        tree = device_info_cache.get(ip)
+        if tree is not None:
+            return tree
+
+    tree = await query(ip, "/query/device-info", timeout)
+    device_info_cache.put(ip, tree)
+    return tree
+
+async def discover_devices(timeout: float = 10.0, concurrency: int = 64, device_timeout: float = 3.0, failed: Optional[list] = None) -> list:
+    """
+    Discover Roku devices on the local network. The SSDP search runs in a
+    worker thread for up to half of `timeout`, then every responding device
+    is queried concurrently.
+
+    :param timeout: Total number of seconds the search may take.
+    :type timeout: float
+
+    :param concurrency: Maximum number of devices queried at the same time.
+    :type concurrency: int
+
+    :param device_timeout: Number of seconds to wait for each device to respond.
+    :type device_timeout: float
+
+    :param failed: If given, a dict containing the IP address and the
+                   exception of each device that couldn't be reached is
+                   appended to this list.
+    :type failed: Optional[list]
+
+    :return: A list of dicts containing the name, IP address, and UDN of each device found.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    search = await asyncio.to_thread(SSDPClient(timeout=min(5, timeout / 2)).m_search, "roku:ecp")
+
+    ips = []
+    seen = set()
+    for response in search:
+        if 'location' not in response:
+            continue
+
+        ip = urlparse(response['location']).hostname
+        usn = response.get('usn', ip)
+        if usn not in seen and ip not in seen:
+            seen.update((usn, ip))
+            ips.append(ip)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(ip):
+        async with semaphore:
+            return await asyncio.wait_for(device_info(ip, cached=False, timeout=device_timeout), max(0, deadline - loop.time()))
+
+    results = await asyncio.gather(*(resolve(ip) for ip in ips), return_exceptions=True)
+
+    devices = []
+    udns = set()
+    for ip, tree in zip(ips, results):
+        if isinstance(tree, Exception):
+            if failed is not None:
+                failed.append({"ip": ip, "error": tree})
+            continue
+
+        udn = tree.findtext('udn')
+        if udn is not None:
+            if udn in udns:
+                continue
+            udns.add(udn)
+
+        devices.append({"name": tree.findtext('user-device-name'), "ip": ip, "udn": udn})
+
+    return devices
+
+async def get_device(ip: str) -> dict:
+    """
+    Get information about a Roku device. See :func:`controku.get_device`.
+    """
+    return _parse_device(ip, await device_info(ip, cached=False))
+
+async def get_device_info(ip: str, cached: bool = False) -> DeviceInfo:
+    """
+    Get everything a Roku device reports about itself. See :func:`controku.get_device_info`.
+    """
+    return DeviceInfo.from_element(ip, await device_info(ip, cached=cached))
+
+async def send_key(ip: str, key: str):
+    """
+    Send a keypress to a Roku device. See :func:`controku.send_key`.
+    """
+    await request(ip, "POST", f"/keypress/{key}")
+    if key.startswith("Power"):
+        device_info_cache.invalidate(ip)
+
+async def toggle_power(ip: str):
+    """
+    Turn a Roku device on or off. See :func:`controku.toggle_power`.
+    """
+    # the power state can change outside controku, e.g. from the remote, so it's never taken from the cache
+    await send_key(ip, _power_key(await device_info(ip, cached=False)))
+
+async def search(ip: str, keyword: str, **options):
+    """
+    Run a search on a Roku device. Takes the same keyword arguments as
+    :func:`controku.search`.
+    """
+    await request(ip, "POST", f"/search/browse?{_search_query(keyword, **options)}")
+
+async def iter_tv_channels(ip: str) -> AsyncIterator[Channel]:
+    """
+    Stream the live TV channels available on a Roku device.
+    See :func:`controku.iter_tv_channels`.
+    """
+    _check_tv(await device_info(ip))
+
+    path = "/query/tv-channels"
+    circuit_breaker.check(ip)
+    start = perf_counter()
+    size = 0
+    parser = _ChannelParser()
+    try:
+        async with get_session().get(f"http://{ip}:8060{path}") as response:
+            async for chunk in response.content.iter_chunked(8192):
+                size += len(chunk)
+                for channel in parser.feed(chunk):
+                    yield channel
+    except (ClientError, asyncio.TimeoutError) as e:
+        _run_request_hooks(ip, "GET", path, perf_counter() - start, size, e)
+        circuit_breaker.failure(ip)
+        raise ConnectionError(f"Couldn't connect to Roku device at {ip}.") from e
+
+    circuit_breaker.success(ip)
+    _run_request_hooks(ip, "GET", path, perf_counter() - start, size, None)
+    for channel in parser.close():
+        yield channel
+
+async def get_tv_channels(ip: str) -> list:
+    """
+    Get a list of the live TV channels available on a Roku device.
+    See :func:`controku.get_tv_channels`.
+    """
+    return [channel.as_dict() async for channel in iter_tv_channels(ip)]
+
+async def get_active_tv_channel(ip: str) -> dict:
+    """
+    Get a Roku device's active live TV channel. See :func:`controku.get_active_tv_channel`.
+    """
+    _check_tv(await device_info(ip))
+    return _parse_active_tv_channel(await query(ip, "/query/tv-active-channel"))
+
+async def get_media_player(ip: str) -> dict:
+    """
+    Get the state of a Roku device's media player. See :func:`controku.get_media_player`.
+    """
+    return _parse_media_player(await query(ip, "/query/media-player"))
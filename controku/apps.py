@@ -0,0 +1,238 @@
+import os
+from collections import OrderedDict
+from controku.controku import get_client
+from threading import Lock
+from time import monotonic
+from typing import Optional, Union
+from urllib.parse import quote, urlencode
+from xml.etree import ElementTree
+
+# Number of devices whose app lists are kept in memory
+APP_CACHE_SIZE = 16
+
+class App:
+    """
+    An app (channel) installed on a Roku device.
+
+    :ivar id: ID of the app, e.g. "12" for Netflix.
+    :ivar name: Name of the app.
+    :ivar type: Type of the app, e.g. "appl" for apps or "tvin" for TV inputs.
+    :ivar version: Version of the app.
+    """
+    __slots__ = ("id", "name", "type", "version")
+
+    def __init__(self, id: str, name: Optional[str], type: Optional[str], version: Optional[str]):
+        self.id = id
+        self.name = name
+        self.type = type
+        self.version = version
+
+    def __repr__(self):
+        return f"App({self.id!r}, {self.name!r})"
+
+    @classmethod
+    def from_element(cls, element: ElementTree.Element) -> "App":
+        """
+        Build an app from an `<app>` element of an apps or active-app document.
+        """
+        return cls(element.get('id'), element.text, element.get('type'), element.get('version'))
+
+    def as_dict(self) -> dict:
+        """
+        :return: The app as a dict containing its ID, name, type, and version.
+        """
+        return {"id": self.id, "name": self.name, "type": self.type, "version": self.version}
+
+class AppCache:
+    """
+    A least recently used cache of the app lists of Roku devices.
+
+    :param size: Maximum number of devices to keep app lists for.
+    :type size: int
+    """
+    def __init__(self, size: int = APP_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, ip: str, max_age: Optional[float]) -> Optional[list]:
+        """
+        Get a device's cached app list.
+
+        :param ip: IP address of the device.
+        :type ip: str
+
+        :param max_age: Number of seconds the list stays valid, or None if it never expires.
+        :type max_age: Optional[float]
+
+        :return: The list of Apps, or None if it isn't cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry is None or max_age is not None and monotonic() - entry[0] >= max_age:
+                return None
+
+            self._entries.move_to_end(ip)
+            return entry[1]
+
+    def put(self, ip: str, apps: list):
+        """
+        Store a device's app list, evicting the least recently used one if the cache is full.
+        """
+        with self._lock:
+            self._entries[ip] = (monotonic(), apps)
+            self._entries.move_to_end(ip)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, ip: Optional[str] = None):
+        """
+        Drop a device's cached app list.
+
+        :param ip: IP address of the device. If not given, the whole cache is cleared.
+        :type ip: Optional[str]
+        """
+        with self._lock:
+            if ip is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(ip, None)
+
+app_cache = AppCache()
+
+def get_apps(ip: str, max_age: Optional[float] = 300.0) -> list:
+    """
+    Get the apps installed on a Roku device. The list is kept in memory
+    and fetched again once it's older than `max_age`.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param max_age: Number of seconds before the list is fetched again. 0
+                    always fetches it, and None never does once cached.
+    :type max_age: Optional[float]
+
+    :return: A list of App records.
+    """
+    apps = app_cache.get(ip, max_age)
+    if apps is None:
+        apps = [App.from_element(element) for element in get_client(ip).query("/query/apps").iter('app')]
+        app_cache.put(ip, apps)
+
+    return apps
+
+def get_active_app(ip: str) -> Optional[App]:
+    """
+    Get the app in the foreground on a Roku device.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :return: The App, or None if the home screen is showing.
+    """
+    element = get_client(ip).query("/query/active-app").find('app')
+    if element is None or element.get('id') is None:
+        return None
+
+    return App.from_element(element)
+
+def find_app(ip: str, query: str) -> Optional[App]:
+    """
+    Find an installed app by its ID or its name, ignoring case.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param query: ID or name of the app.
+    :type query: str
+
+    :return: The App, or None if nothing matched.
+    """
+    apps = get_apps(ip)
+    for app in apps:
+        if app.id == query:
+            return app
+
+    for app in apps:
+        if app.name is not None and app.name.casefold() == query.casefold():
+            return app
+
+    return None
+
+def launch_app(ip: str, app: Union[str, App], **params):
+    """
+    Launch an app on a Roku device.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param app: The app to launch, or its ID.
+    :type app: str | App
+
+    Any keyword arguments are passed to the app as launch parameters, e.g.
+    contentId and mediaType for deep linking.
+    """
+    app_id = app.id if isinstance(app, App) else app
+    path = f"/launch/{quote(app_id, safe='')}"
+    if params:
+        path += "?" + urlencode(params)
+
+    get_client(ip).request("POST", path)
+
+def icon_cache_dir() -> str:
+    """
+    :return: The directory app icons are cached in, inside controku's cache directory.
+    """
+    from controku.registry import default_cache_dir
+    return os.path.join(default_cache_dir(), "icons")
+
+def get_app_icon(ip: str, app: Union[str, App], cache_dir: Optional[str] = None) -> bytes:
+    """
+    Get the icon of an app installed on a Roku device.
+
+    Icons are cached on disk by app ID and version, so they're shared
+    between devices and fetched again only when the app is updated.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param app: The app, or its ID. Given an ID, the device's app list is
+                used to look up its version.
+    :type app: str | App
+
+    :param cache_dir: Directory to cache icons in. Defaults to :func:`icon_cache_dir`.
+    :type cache_dir: Optional[str]
+
+    :return: The icon image, usually a PNG or JPEG.
+    """
+    if not isinstance(app, App):
+        app_id = app
+        app = next((candidate for candidate in get_apps(ip) if candidate.id == app_id), None)
+        if app is None:
+            raise ValueError(f"No app with ID `{app_id}` on this Roku device.")
+
+    cache_dir = icon_cache_dir() if cache_dir is None else cache_dir
+    name = quote(app.id, safe="")
+    path = os.path.join(cache_dir, f"{name}-{quote(app.version or '', safe='')}")
+    try:
+        with open(path, "rb") as file:
+            return file.read()
+    except FileNotFoundError:
+        pass
+
+    icon = get_client(ip).request("GET", f"/query/icon/{name}")
+    if not icon:
+        raise ValueError(f"Roku device has no icon for app `{app.id}`.")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for old in os.listdir(cache_dir):
+        # icons of other versions of the app are stale now
+        if old.startswith(name + "-") and not old.endswith(".tmp"):
+            os.remove(os.path.join(cache_dir, old))
+
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(icon)
+    os.replace(temporary, path)
+
+    return icon
@@ -0,0 +1,192 @@
+from bisect import bisect_left, insort
+from controku.controku import Channel, _ChannelParser, _check_tv, get_client
+from difflib import get_close_matches
+from hashlib import blake2b
+from threading import Lock
+from time import monotonic
+from typing import Optional, Union
+
+def _normalize(name: str) -> str:
+    return "".join(character for character in name.casefold() if character.isalnum())
+
+class ChannelIndex:
+    """
+    A live TV channel lineup indexed by virtual channel number, physical
+    channel number, and normalized name.
+
+    :param channels: The channels to index.
+    :type channels: list
+    """
+    def __init__(self, channels: list = ()):
+        self.by_number = {}
+        self.by_physical = {}
+        self.by_name = {}
+        self._names = []
+        self.digest = None
+        self.updated = None
+        self.lock = Lock()
+        self.update(channels)
+
+    def __len__(self):
+        return len(self.by_number)
+
+    def __iter__(self):
+        return iter(self.by_number.values())
+
+    def _add(self, channel: Channel):
+        self.by_number[channel.number] = channel
+        self.by_physical.setdefault(channel.channel, []).append(channel)
+        name = _normalize(channel.name or "")
+        if name not in self.by_name:
+            insort(self._names, name)
+        self.by_name.setdefault(name, []).append(channel)
+
+    def _remove(self, channel: Channel):
+        del self.by_number[channel.number]
+        for index, key in ((self.by_physical, channel.channel), (self.by_name, _normalize(channel.name or ""))):
+            index[key].remove(channel)
+            if not index[key]:
+                del index[key]
+                if index is self.by_name:
+                    del self._names[bisect_left(self._names, key)]
+
+    def update(self, channels: list) -> int:
+        """
+        Bring the index up to date with a new lineup, re-indexing only
+        channels that were added, removed, or changed.
+
+        :param channels: The new lineup.
+        :type channels: list
+
+        :return: The number of channels that were added, removed, or changed.
+        """
+        new = {channel.number: channel for channel in channels}
+        changes = 0
+        for number, channel in list(self.by_number.items()):
+            replacement = new.get(number)
+            if replacement is None or replacement.as_dict() != channel.as_dict():
+                self._remove(channel)
+                changes += 1
+
+        for number, channel in new.items():
+            if number not in self.by_number:
+                self._add(channel)
+                changes += 1
+
+        self.updated = monotonic()
+        return changes
+
+    def lookup(self, query: str) -> Optional[Channel]:
+        """
+        Find a channel by its virtual channel number (e.g. "2.1"), its exact
+        name (ignoring case, spaces, and punctuation), or its physical
+        channel number, in that order.
+
+        :param query: What to look for.
+        :type query: str
+
+        :return: The channel, or None if nothing matched.
+        """
+        channel = self.by_number.get(query)
+        if channel is not None:
+            return channel
+
+        for index, key in ((self.by_name, _normalize(query)), (self.by_physical, query)):
+            channels = index.get(key)
+            if channels:
+                return channels[0]
+
+        return None
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """
+        Find channels whose names start with, or closely resemble, a query.
+
+        :param query: The name, or beginning of the name, to look for.
+        :type query: str
+
+        :param limit: Maximum number of channels to return.
+        :type limit: int
+
+        :return: A list of Channel records, prefix matches first.
+        """
+        key = _normalize(query)
+        names = []
+        for name in self._names[bisect_left(self._names, key):]:
+            if not name.startswith(key) or len(names) >= limit:
+                break
+            names.append(name)
+
+        if len(names) < limit:
+            names += [name for name in get_close_matches(key, self._names, limit, 0.6) if name not in names]
+
+        results = []
+        for name in names:
+            results += self.by_name[name]
+        return results[:limit]
+
+_indexes = {}
+_indexes_lock = Lock()
+
+def get_channel_index(ip: str, max_age: Optional[float] = 300.0) -> ChannelIndex:
+    """
+    Get the indexed live TV channel lineup of a Roku TV. The index is kept
+    between calls and refreshed once it's older than `max_age`; when the
+    lineup the TV returns hasn't changed, nothing is parsed again.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param max_age: Number of seconds before the index is refreshed. 0
+                    always refreshes it, and None never does once built.
+    :type max_age: Optional[float]
+
+    :return: The device's ChannelIndex.
+    """
+    with _indexes_lock:
+        index = _indexes.get(ip)
+        if index is None:
+            index = _indexes[ip] = ChannelIndex()
+
+    with index.lock:
+        if index.digest is not None and (max_age is None or monotonic() - index.updated < max_age):
+            return index
+
+        client = get_client(ip)
+        _check_tv(client.device_info())
+        body = client.request("GET", "/query/tv-channels")
+        digest = blake2b(body, digest_size=16).digest()
+        if digest == index.digest:
+            index.updated = monotonic()
+            return index
+
+        parser = _ChannelParser()
+        index.update(parser.feed(body) + parser.close())
+        index.digest = digest
+        return index
+
+def tune(ip: str, channel: Union[str, Channel]) -> Channel:
+    """
+    Switch a Roku TV to a live TV channel.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param channel: The channel to tune to; either a Channel record, or a
+                    virtual channel number, name, or physical channel number
+                    looked up with :meth:`ChannelIndex.lookup`.
+    :type channel: str | Channel
+
+    :return: The channel that was tuned to.
+    """
+    if not isinstance(channel, Channel):
+        query = channel
+        channel = get_channel_index(ip, max_age=None).lookup(query)
+        if channel is None:
+            # the lineup may have changed since it was indexed
+            channel = get_channel_index(ip, max_age=0).lookup(query)
+        if channel is None:
+            raise ValueError(f"No channel matching `{query}` on this Roku device.")
+
+    get_client(ip).request("POST", f"/launch/tvinput.dtv?ch={channel.number}")
+    return channel
@@ -0,0 +1,239 @@
+"""
+Command line interface for controlling Roku devices without the GUI.
+
+Start-up time matters for hotkeys and automation hooks, so this module
+only imports argparse up front; each command imports what it needs. When
+a controku daemon is running, commands are sent to it instead. The
+controku package is still loaded, but requests and ssdpy aren't, and no
+new connection to the device has to be set up.
+"""
+import argparse
+import os
+import sys
+
+def _device(args) -> str:
+    device = args.device or os.environ.get("CONTROKU_DEVICE")
+    if not device:
+        sys.exit("controku: no device given; use --device or set CONTROKU_DEVICE")
+
+    if device.replace(".", "").isdigit() or ":" in device:
+        return device
+
+    # not an IP address, so look it up by name among remembered devices
+    from controku.registry import DeviceRegistry
+    for entry in DeviceRegistry():
+        if entry['name'] is not None and entry['name'].casefold() == device.casefold():
+            if entry['ip'] is None:
+                sys.exit(f"controku: the address of `{device}` isn't known anymore; run `controku-cli discover --remember` to find it")
+            return entry['ip']
+
+    sys.exit(f"controku: no remembered device named `{device}`")
+
+def _call(args, command: str, *arguments, **options):
+    if not args.no_daemon:
+        from controku.daemon import connect
+        client = connect(args.socket)
+        if client is not None:
+            with client:
+                return client.call(command, *arguments, **options)
+
+    from controku.daemon import COMMANDS
+    from importlib import import_module
+    return getattr(import_module(COMMANDS[command]), command)(*arguments, **options)
+
+def _print(data, as_json: bool):
+    if as_json:
+        import json
+        print(json.dumps(data))
+    elif isinstance(data, dict):
+        for name, value in data.items():
+            print(f"{name}: {value}")
+    else:
+        print(data)
+
+def key(args):
+    ip = _device(args)
+    if len(args.keys) == 1 and not args.gap:
+        _call(args, "send_key", ip, args.keys[0])
+    else:
+        _call(args, "send_keys", ip, args.keys, gap=args.gap)
+
+def text(args):
+    _call(args, "send_text", _device(args), " ".join(args.text))
+
+def power(args):
+    ip = _device(args)
+    match args.state:
+        case "on":
+            _call(args, "send_key", ip, "PowerOn")
+        case "off":
+            _call(args, "send_key", ip, "PowerOff")
+        case _:
+            _call(args, "toggle_power", ip)
+
+def info(args):
+    _print(_call(args, "get_device", _device(args)), args.json)
+
+def channels(args):
+    ip = _device(args)
+    if args.active:
+        _print(_call(args, "get_active_tv_channel", ip), args.json)
+        return
+
+    for channel in _call(args, "get_tv_channels", ip):
+        if args.json:
+            _print(channel, True)
+        else:
+            print(f"{channel['number']}\t{channel['name']}")
+
+def apps(args):
+    ip = _device(args)
+    if args.active:
+        app = _call(args, "get_active_app", ip)
+        _print(app if isinstance(app, dict) or app is None else app.as_dict(), args.json)
+        return
+
+    for app in _call(args, "get_apps", ip):
+        app = app if isinstance(app, dict) else app.as_dict()
+        if args.json:
+            _print(app, True)
+        else:
+            print(f"{app['id']}\t{app['name']}")
+
+def launch(args):
+    ip = _device(args)
+    app = _call(args, "find_app", ip, args.app)
+    if app is None:
+        sys.exit(f"controku: no app matching `{args.app}`")
+
+    _call(args, "launch_app", ip, app['id'] if isinstance(app, dict) else app.id)
+
+def discover(args):
+    import controku
+    registry = None
+    if args.remember:
+        from controku.registry import DeviceRegistry
+        registry = DeviceRegistry()
+
+    failed = []
+    if args.sweep:
+        devices = controku.iter_sweep(args.sweep, failed=failed)
+    else:
+        devices = controku.iter_devices(timeout=args.timeout, failed=failed)
+
+    for device in devices:
+        if args.json:
+            _print(device, True)
+        else:
+            print(f"{device['ip']}\t{device['name']}", flush=True)
+        if registry is not None:
+            registry.remember(device)
+
+    for failure in failed:
+        print(f"controku: {failure['ip']}: {failure['error']}", file=sys.stderr)
+    if registry is not None:
+        registry.save()
+
+def inventory(args):
+    from controku.fleet import iter_inventory, write_inventory
+
+    def devices():
+        yield from args.devices
+        if args.file is not None:
+            with open(args.file) as file:
+                for line in file:
+                    if line.strip() and not line.startswith("#"):
+                        yield line.strip()
+        if not args.devices and args.file is None:
+            from controku.registry import DeviceRegistry
+            for entry in DeviceRegistry():
+                if entry['ip'] is not None:
+                    yield entry['ip']
+
+    records = iter_inventory(devices(), channel=args.channel, concurrency=args.concurrency, timeout=args.timeout)
+    if args.output is None:
+        count, failures = write_inventory(records, sys.stdout, args.format)
+    else:
+        with open(args.output, "w", newline="") as file:
+            count, failures = write_inventory(records, file, args.format)
+
+    if failures:
+        print(f"controku: {failures} of {count} devices failed", file=sys.stderr)
+        sys.exit(1)
+
+def daemon(args):
+    from controku.daemon import serve
+    try:
+        serve(args.socket, warm=not args.no_warm)
+    except RuntimeError as e:
+        sys.exit(f"controku: {e}")
+    except KeyboardInterrupt:
+        pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="controku-cli", description="Control Roku devices from the command line.")
+    parser.add_argument("-d", "--device", help="IP address or remembered name of the device (default: $CONTROKU_DEVICE)")
+    parser.add_argument("--socket", help="path of the daemon's socket")
+    parser.add_argument("--no-daemon", action="store_true", help="don't send commands through a running daemon")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    command = commands.add_parser("key", help="send one or more keypresses")
+    command.add_argument("keys", nargs="+", help="keys to send, e.g. Home or VolumeUp")
+    command.add_argument("--gap", type=float, default=0.0, help="minimum seconds between keys")
+    command.set_defaults(function=key)
+
+    command = commands.add_parser("text", help="type text into the device's on-screen keyboard")
+    command.add_argument("text", nargs="+", help="text to type; multiple arguments are joined with spaces")
+    command.set_defaults(function=text)
+
+    command = commands.add_parser("power", help="turn the device on or off")
+    command.add_argument("state", nargs="?", choices=["on", "off", "toggle"], default="toggle")
+    command.set_defaults(function=power)
+
+    command = commands.add_parser("info", help="show information about the device")
+    command.add_argument("--json", action="store_true", help="print JSON")
+    command.set_defaults(function=info)
+
+    command = commands.add_parser("channels", help="list the device's live TV channels")
+    command.add_argument("--active", action="store_true", help="show only the active channel")
+    command.add_argument("--json", action="store_true", help="print JSON, one object per line")
+    command.set_defaults(function=channels)
+
+    command = commands.add_parser("apps", help="list the apps installed on the device")
+    command.add_argument("--active", action="store_true", help="show only the app in the foreground")
+    command.add_argument("--json", action="store_true", help="print JSON, one object per line")
+    command.set_defaults(function=apps)
+
+    command = commands.add_parser("launch", help="launch an app")
+    command.add_argument("app", help="ID or name of the app, e.g. 12 or Netflix")
+    command.set_defaults(function=launch)
+
+    command = commands.add_parser("discover", help="search the local network for devices")
+    command.add_argument("--timeout", type=float, default=10.0, help="seconds to search for (default: 10)")
+    command.add_argument("--sweep", action="append", metavar="CIDR", help="try every address in an IP range instead of using SSDP, e.g. 10.1.0.0/22; can be given more than once")
+    command.add_argument("--remember", action="store_true", help="add found devices to the remembered devices")
+    command.add_argument("--json", action="store_true", help="print JSON, one object per line")
+    command.set_defaults(function=discover)
+
+    command = commands.add_parser("inventory", help="collect information about many devices at once")
+    command.add_argument("devices", nargs="*", help="IP addresses of the devices (default: every remembered device)")
+    command.add_argument("-f", "--file", help="file listing one device IP address per line")
+    command.add_argument("--channel", action="store_true", help="also get the active channel of each TV")
+    command.add_argument("--format", choices=["jsonl", "csv"], default="jsonl", help="output format (default: jsonl)")
+    command.add_argument("-o", "--output", help="file to write to (default: standard output)")
+    command.add_argument("-c", "--concurrency", type=int, default=32, help="maximum number of devices handled at once (default: 32)")
+    command.add_argument("-t", "--timeout", type=float, default=10.0, help="seconds each device is given to answer (default: 10)")
+    command.set_defaults(function=inventory)
+
+    command = commands.add_parser("daemon", help="run a daemon that keeps connections to devices open")
+    command.add_argument("--no-warm", action="store_true", help="don't connect to remembered devices at start")
+    command.set_defaults(function=daemon)
+
+    args = parser.parse_args(argv)
+    try:
+        args.function(args)
+    except (ConnectionError, ValueError) as e:
+        sys.exit(f"controku: {e}")
+
+if __name__ == "__main__":
+    main()
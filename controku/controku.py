@@ -1,31 +1,1104 @@
-from requests import get, post
-from ssdpy import SSDPClient
-from typing import Optional
-from urllib.parse import quote
+import logging
+import random
+import socket
+from controku.metrics import metrics as _metrics
+from threading import Lock, Thread, Timer
+from time import monotonic, perf_counter, sleep
+from typing import Iterator, Optional
+from urllib.parse import quote, urlparse
 from xml.etree import ElementTree
 
-def discover_devices() -> list:
+_log = logging.getLogger(__name__)
+
+# requests and ssdpy are slow to import, so they're imported by the code
+# that uses them; a script that only sends a keypress never loads ssdpy,
+# and importing controku itself loads neither.
+
+# (connect, read) timeouts in seconds used for every request to a device
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Number of times a failed GET is retried; commands (POSTs) are never retried
+RETRIES = 2
+
+# Upper bound in seconds of the random delay before the first retry, doubled for each one after it
+RETRY_DELAY = 0.1
+
+# Seconds a held key stays down without being renewed before it's released automatically
+HOLD_TIMEOUT = 2.0
+
+class DeviceInfoCache:
+    """
+    A per-device cache of parsed `/query/device-info` responses.
+
+    Entries expire after `ttl` seconds. Static fields like `is-tv` never
+    change, but others like `power-mode` do, so the cache should be
+    invalidated whenever a command is known to change the device's state.
+
+    :param ttl: Number of seconds an entry stays valid.
+    :type ttl: float
+    """
+    def __init__(self, ttl: float = 10.0):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = Lock()
+
+    def get(self, ip: str) -> Optional[ElementTree.Element]:
+        """
+        Get a device's cached device-info.
+
+        :param ip: IP address of the device.
+        :type ip: str
+
+        :return: The root element of the device-info document, or None
+                 if it isn't cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry is not None and monotonic() - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            return None
+
+    def put(self, ip: str, tree: ElementTree.Element):
+        """
+        Store a device's device-info.
+
+        :param ip: IP address of the device.
+        :type ip: str
+
+        :param tree: The root element of the device-info document.
+        :type tree: ElementTree.Element
+        """
+        with self._lock:
+            self._entries[ip] = (monotonic(), tree)
+
+    def invalidate(self, ip: Optional[str] = None):
+        """
+        Drop a device's cached device-info.
+
+        :param ip: IP address of the device. If not given, the whole cache is cleared.
+        :type ip: Optional[str]
+        """
+        with self._lock:
+            if ip is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(ip, None)
+
+    def stats(self) -> dict:
+        """
+        Get the cache's hit and miss counters.
+
+        :return: A dict containing the number of hits, misses, and cached devices.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+device_info_cache = DeviceInfoCache()
+
+class CircuitBreaker:
+    """
+    Tracks which Roku devices are unreachable, so that requests to them fail
+    immediately instead of each waiting for its own timeouts.
+
+    After `threshold` requests to a device fail in a row, its circuit
+    opens: requests raise ConnectionError without being sent, and a
+    background thread checks whether the device accepts connections again,
+    waiting longer between each check. Once it does, the circuit closes.
+
+    :param threshold: Number of failed requests in a row that opens a device's circuit.
+    :type threshold: int
+
+    :param probe_interval: Seconds before the first background check.
+    :type probe_interval: float
+
+    :param max_probe_interval: Maximum seconds between background checks.
+    :type max_probe_interval: float
+    """
+    def __init__(self, threshold: int = 3, probe_interval: float = 1.0, max_probe_interval: float = 30.0):
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self._failures = {}
+        self._open = {}
+        self._lock = Lock()
+
+    def is_open(self, ip: str) -> bool:
+        """
+        :return: Whether requests to the device currently fail fast.
+        """
+        return ip in self._open
+
+    def check(self, ip: str):
+        """
+        Raise ConnectionError if the device's circuit is open.
+
+        :param ip: IP address of the device.
+        :type ip: str
+        """
+        if ip in self._open:
+            raise ConnectionError(f"Roku device at {ip} is unreachable; waiting for it to come back.")
+
+    def success(self, ip: str):
+        """
+        Record a successful request, closing the device's circuit.
+
+        :param ip: IP address of the device.
+        :type ip: str
+        """
+        if ip in self._failures or ip in self._open:
+            with self._lock:
+                self._failures.pop(ip, None)
+                self._open.pop(ip, None)
+
+    def failure(self, ip: str):
+        """
+        Record a failed request, opening the device's circuit if there have been too many.
+
+        :param ip: IP address of the device.
+        :type ip: str
+        """
+        with self._lock:
+            failures = self._failures[ip] = self._failures.get(ip, 0) + 1
+            if failures < self.threshold or ip in self._open:
+                return
+
+            token = self._open[ip] = object()
+
+        Thread(target=self._probe, args=(ip, token), daemon=True).start()
+
+    def reset(self, ip: Optional[str] = None):
+        """
+        Close a device's circuit and forget its failures.
+
+        :param ip: IP address of the device. If not given, every circuit is closed.
+        :type ip: Optional[str]
+        """
+        with self._lock:
+            if ip is None:
+                self._failures.clear()
+                self._open.clear()
+            else:
+                self._failures.pop(ip, None)
+                self._open.pop(ip, None)
+
+    def _probe(self, ip: str, token: object):
+        interval = self.probe_interval
+        while True:
+            sleep(interval)
+            if self._open.get(ip) is not token:
+                # closed by a request or reset in the meantime
+                return
+
+            try:
+                socket.create_connection((ip, 8060), timeout=DEFAULT_TIMEOUT[0]).close()
+            except OSError:
+                interval = min(interval * 2, self.max_probe_interval)
+                continue
+
+            with self._lock:
+                if self._open.get(ip) is token:
+                    del self._open[ip]
+                    self._failures.pop(ip, None)
+            return
+
+circuit_breaker = CircuitBreaker()
+
+# Functions called after every request with the device's IP address, the
+# method, the path, the elapsed time in seconds, the size of the response
+# body in bytes, and the exception raised (or None)
+request_hooks = [_metrics]
+
+def add_request_hook(hook):
+    """
+    Register a function to be called after every request to a Roku device.
+
+    :param hook: Function taking the device's IP address, the HTTP method,
+                 the request path, the elapsed time in seconds, the size of
+                 the response body in bytes, and the exception raised, or
+                 None if the request succeeded.
+    :type hook: Callable
+    """
+    request_hooks.append(hook)
+
+def remove_request_hook(hook):
+    """
+    Unregister a function added with :func:`add_request_hook`.
+
+    :param hook: The function to remove.
+    :type hook: Callable
+    """
+    request_hooks.remove(hook)
+
+def _run_request_hooks(ip: str, method: str, path: str, elapsed: float, size: int, error: Optional[Exception]):
+    # a broken hook mustn't turn a request that reached the device into an error
+    for hook in list(request_hooks):
+        try:
+            hook(ip, method, path, elapsed, size, error)
+        except Exception:
+            _log.exception("Error in request hook")
+
+# Whether the device counts as on in each power mode
+POWER_MODES = {"PowerOn": True, "Ready": False, "DisplayOff": False, "Headless": False}
+
+def _boolean(text: Optional[str]) -> bool:
+    return text == "true"
+
+def _integer(text: Optional[str]) -> Optional[int]:
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return None
+
+class DeviceInfo:
+    """
+    A Roku device's `/query/device-info` document, parsed in one pass.
+
+    Commonly used fields are attributes converted to Python types, and
+    None when the device doesn't report them. Any other tag can be read
+    as text with :meth:`get` or indexing, e.g. `info["time-zone-name"]`.
+
+    :ivar ip: IP address of the device.
+    :ivar name: User-set name of the device.
+    :ivar location: User-set location of the device.
+    :ivar power_mode: Power mode, e.g. "PowerOn", "Ready", or "DisplayOff".
+    :ivar model: Friendly model name, e.g. "Roku Ultra".
+    :ivar model_name: Model name, e.g. "4800X".
+    :ivar model_number: Model number, e.g. "4800X".
+    :ivar vendor: Vendor name.
+    :ivar serial: Serial number.
+    :ivar device_id: Device ID.
+    :ivar udn: UDN, which identifies the device across IP address changes.
+    :ivar resolution: Current UI resolution, e.g. "1080p".
+    :ivar mac: Wi-Fi MAC address.
+    :ivar ethernet_mac: Ethernet MAC address.
+    :ivar network_type: "wifi" or "ethernet".
+    :ivar network_name: Name of the Wi-Fi network.
+    :ivar software: OS version.
+    :ivar software_build: OS build number.
+    :ivar uptime: Seconds since the device started.
+    :ivar time_zone_offset: Offset of the device's time zone from UTC in minutes.
+    :ivar language: Language code, e.g. "en".
+    :ivar country: Country code, e.g. "US".
+    :ivar tv: Whether the device is a Roku TV.
+    :ivar stick: Whether the device is a streaming stick.
+    :ivar devmode: Whether developer mode is enabled.
+    :ivar netsound: Whether the device supports Private Listening.
+    :ivar headphones: Whether headphones are connected for Private Listening.
+    """
+    __slots__ = (
+        "ip", "name", "location", "power_mode", "model", "model_name", "model_number", "vendor",
+        "serial", "device_id", "udn", "resolution", "mac", "ethernet_mac", "network_type",
+        "network_name", "software", "software_build", "uptime", "time_zone_offset", "language",
+        "country", "tv", "stick", "devmode", "netsound", "headphones", "_element", "_tags",
+    )
+
+    # The tags mapped to attributes, with the function converting each one's text
+    FIELDS = {
+        "user-device-name": ("name", str),
+        "user-device-location": ("location", str),
+        "power-mode": ("power_mode", str),
+        "friendly-model-name": ("model", str),
+        "model-name": ("model_name", str),
+        "model-number": ("model_number", str),
+        "vendor-name": ("vendor", str),
+        "serial-number": ("serial", str),
+        "device-id": ("device_id", str),
+        "udn": ("udn", str),
+        "ui-resolution": ("resolution", str),
+        "wifi-mac": ("mac", str),
+        "ethernet-mac": ("ethernet_mac", str),
+        "network-type": ("network_type", str),
+        "network-name": ("network_name", str),
+        "software-version": ("software", str),
+        "software-build": ("software_build", _integer),
+        "uptime": ("uptime", _integer),
+        "time-zone-offset": ("time_zone_offset", _integer),
+        "language": ("language", str),
+        "country": ("country", str),
+        "is-tv": ("tv", _boolean),
+        "is-stick": ("stick", _boolean),
+        "developer-enabled": ("devmode", _boolean),
+        "supports-private-listening": ("netsound", _boolean),
+        "headphones-connected": ("headphones", _boolean),
+    }
+
+    # Attributes that are None when their tag is missing, and flags, which are False
+    _OPTIONAL = tuple(attribute for attribute, convert in FIELDS.values() if convert is not _boolean)
+    _FLAGS = tuple(attribute for attribute, convert in FIELDS.values() if convert is _boolean)
+
+    def __repr__(self):
+        return f"DeviceInfo({self.ip!r}, {self.name!r})"
+
+    @classmethod
+    def from_element(cls, ip: str, element: ElementTree.Element) -> "DeviceInfo":
+        """
+        Build a record from the root element of a device-info document.
+
+        :param ip: IP address of the device.
+        :type ip: str
+
+        :param element: The root element.
+        :type element: ElementTree.Element
+        """
+        info = cls.__new__(cls)
+        info.ip = ip
+        info._element = element
+        info._tags = None
+        for attribute in cls._OPTIONAL:
+            setattr(info, attribute, None)
+        for attribute in cls._FLAGS:
+            setattr(info, attribute, False)
+
+        fields = cls.FIELDS
+        for child in element:
+            field = fields.get(child.tag)
+            if field is not None and child.text is not None:
+                setattr(info, field[0], field[1](child.text))
+
+        return info
+
+    @property
+    def power(self) -> Optional[bool]:
+        """
+        Whether the device is on: True in the PowerOn power mode, False in
+        standby modes, and None if the power mode isn't known.
+        """
+        return POWER_MODES.get(self.power_mode)
+
+    def get(self, tag: str, default: Optional[str] = None) -> Optional[str]:
+        """
+        Get the text of any tag in the document, including ones without an attribute.
+
+        :param tag: Name of the tag, e.g. "time-zone-name".
+        :type tag: str
+
+        :param default: Returned if the document doesn't have the tag.
+        :type default: Optional[str]
+        """
+        return self._tag_texts().get(tag, default)
+
+    def __getitem__(self, tag: str) -> Optional[str]:
+        return self._tag_texts()[tag]
+
+    def __contains__(self, tag: str):
+        return tag in self._tag_texts()
+
+    def _tag_texts(self) -> dict:
+        # only built when a tag is looked up by name
+        if self._tags is None:
+            self._tags = {child.tag: child.text for child in self._element}
+        return self._tags
+
+    def as_dict(self) -> dict:
+        """
+        :return: The record as a dict, in the format returned by :func:`get_device`.
+        """
+        return {
+            "name": self.name, "ip": self.ip, "location": self.location, "power": self.power,
+            "model": self.model, "serial": self.serial, "udn": self.udn, "resolution": self.resolution,
+            "mac": self.mac, "software": self.software, "tv": self.tv, "stick": self.stick,
+            "devmode": self.devmode, "netsound": self.netsound, "headphones": self.headphones,
+            "power_mode": self.power_mode, "vendor": self.vendor, "model_name": self.model_name,
+            "model_number": self.model_number, "device_id": self.device_id,
+            "ethernet_mac": self.ethernet_mac, "network_type": self.network_type,
+            "network_name": self.network_name, "software_build": self.software_build,
+            "uptime": self.uptime, "time_zone_offset": self.time_zone_offset,
+            "language": self.language, "country": self.country,
+        }
+
+def _parse_device(ip: str, tree: ElementTree.Element) -> dict:
+    return DeviceInfo.from_element(ip, tree).as_dict()
+
+def _power_key(tree: ElementTree.Element) -> str:
+    match POWER_MODES.get(tree.findtext('power-mode')):
+        case False:
+            return "PowerOn"
+        case True:
+            return "PowerOff"
+        case _:
+            raise ValueError("Roku is in unknown power state.")
+
+def _check_tv(tree: ElementTree.Element):
+    if tree.findtext('is-tv') != "true":
+        raise ValueError("This Roku device is not a TV.")
+
+class Channel:
+    """
+    A live TV channel from a Roku TV's lineup.
+
+    :ivar name: Name of the channel.
+    :ivar number: Virtual channel number, e.g. "2.1".
+    :ivar type: Type of the channel, e.g. "air-digital".
+    :ivar channel: Real physical channel number (different from the virtual number).
+    :ivar hidden: "true" if the user has hidden the channel, otherwise "false".
+    :ivar favorite: "true" if the user has listed the channel as a favorite, otherwise "false".
+    """
+    __slots__ = ("name", "number", "type", "channel", "hidden", "favorite")
+
+    def __init__(self, name: Optional[str], number: Optional[str], type: Optional[str], channel: Optional[str], hidden: Optional[str], favorite: Optional[str]):
+        self.name = name
+        self.number = number
+        self.type = type
+        self.channel = channel
+        self.hidden = hidden
+        self.favorite = favorite
+
+    def __repr__(self):
+        return f"Channel({self.number!r}, {self.name!r})"
+
+    @classmethod
+    def from_element(cls, element: ElementTree.Element) -> "Channel":
+        """
+        Build a channel from a `<channel>` element of a tv-channels document.
+        """
+        fields = {child.tag: child.text for child in element}
+        return cls(fields.get('name'), fields.get('number'), fields.get('type'), fields.get('physical-channel'), fields.get('user-hidden'), fields.get('user-favorite'))
+
+    def as_dict(self) -> dict:
+        """
+        :return: The channel as a dict, in the format returned by :func:`get_tv_channels`.
+        """
+        return {"name": self.name, "number": self.number, "type": self.type, "channel": self.channel, "hidden": self.hidden, "favorite": self.favorite}
+
+class _ChannelParser:
+    # Incrementally parses a tv-channels document fed to it in chunks,
+    # dropping each channel's elements once it has been read.
+    def __init__(self):
+        self.parser = ElementTree.XMLPullParser(("start", "end"))
+        self.root = None
+
+    def feed(self, data: bytes) -> list:
+        self.parser.feed(data)
+        return self.read()
+
+    def close(self) -> list:
+        self.parser.close()
+        return self.read()
+
+    def read(self) -> list:
+        channels = []
+        for event, element in self.parser.read_events():
+            if self.root is None:
+                self.root = element
+            elif event == "end" and element.tag == "channel":
+                channels.append(Channel.from_element(element))
+                self.root.clear()
+
+        return channels
+
+def _parse_active_tv_channel(tree: ElementTree.Element) -> dict:
+    tree = tree[0]
+    channel = {}
+    channel['name'] = tree.findtext('name')
+    channel['number'] = tree.findtext('number')
+    channel['type'] = tree.findtext('type')
+    channel['channel'] = tree.findtext('physical-channel')
+    channel['hidden'] = tree.findtext('user-hidden')
+    channel['favorite'] = tree.findtext('user-favorite')
+    channel['active'] = tree.findtext('active-input') == "true"
+
+    match tree.findtext('signal-state'):
+        case "valid":
+            channel['signal'] = True
+        case "none":
+            channel['signal'] = False
+
+    channel['resolution'] = tree.findtext('signal-mode')
+    channel['title'] = tree.findtext('program-title')
+    channel['description'] = tree.findtext('program-description')
+    channel['rating'] = tree.findtext('program-ratings')
+    channel['captions'] = tree.findtext('program-has-cc') == "true"
+
+    return channel
+
+def _milliseconds(text: Optional[str]) -> Optional[int]:
+    # media-player times look like "12345 ms"
+    if text is None:
+        return None
+
+    try:
+        return int(text.split()[0])
+    except (ValueError, IndexError):
+        return None
+
+def _parse_media_player(tree: ElementTree.Element) -> dict:
+    player = {}
+    player['state'] = tree.get('state')
+    player['error'] = tree.get('error') == "true"
+
+    plugin = tree.find('plugin')
+    player['app'] = None if plugin is None else plugin.get('name')
+    player['app_id'] = None if plugin is None else plugin.get('id')
+
+    player['position'] = _milliseconds(tree.findtext('position'))
+    player['duration'] = _milliseconds(tree.findtext('duration'))
+    player['live'] = tree.findtext('is_live') == "true"
+
+    return player
+
+def _search_query(keyword: str, title: Optional[str] = None, type: Optional[str] = None, tmsid: Optional[str] = None, season: Optional[int] = None, unavailable: Optional[bool] = None, matchany: Optional[bool] = None, providerid: Optional[str] = None, provider: Optional[str] = None, launch: Optional[bool] = None) -> str:
+    options = ["keyword", "title", "type", "tmsid", "season", "unavailable", "matchany", "providerid", "provider", "launch"]
+    selected_options = []
+    for option in options:
+        if locals()[option] is not None:
+            if option == "type":
+                if type not in ["movie", "tv-show", "person", "channel", "game"]:
+                    raise ValueError("`type` must be one of 'movie', 'tv-show', 'person', 'channel', or 'game'.")
+
+            selected_options.append({"name": option, "value": locals()[option]})
+
+    query = ""
+    for option in selected_options:
+        if option['value'] == True:
+            option['value'] == "true"
+        elif option['value'] == False:
+            option['value'] == "false"
+
+        query += f"{option['name']}={option['value']}&"
+
+    return quote(query[:-1], safe="/=&")
+
+class RokuClient:
+    """
+    A persistent connection to a Roku device's External Control Protocol.
+
+    All requests go through one keep-alive session, so repeated calls
+    (such as several keypresses in a row) reuse the same TCP connection
+    instead of opening a new one each time.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param timeout: Connect and read timeouts in seconds, either as a single
+                    number or a (connect, read) tuple.
+    :type timeout: float | tuple
+
+    :param pool_size: Maximum number of connections kept open to the device.
+    :type pool_size: int
+
+    :param cache: Cache used for the device's device-info. Defaults to the shared `device_info_cache`.
+    :type cache: Optional[DeviceInfoCache]
+
+    :param breaker: Circuit breaker used for the device. Defaults to the shared `circuit_breaker`.
+    :type breaker: Optional[CircuitBreaker]
+    """
+    def __init__(self, ip: str, timeout=DEFAULT_TIMEOUT, pool_size: int = 1, cache: Optional[DeviceInfoCache] = None, breaker: Optional[CircuitBreaker] = None):
+        self.ip = ip
+        self.timeout = timeout
+        self.cache = device_info_cache if cache is None else cache
+        self.breaker = circuit_breaker if breaker is None else breaker
+        self.base_url = f"http://{ip}:8060"
+
+        from requests import Session
+        from requests.adapters import HTTPAdapter
+
+        self.session = Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self._held = {}
+        self._held_lock = Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Release any held keys and close all open connections to the device.
+        """
+        self.release_all()
+        self.session.close()
+
+    def request(self, method: str, path: str, timeout=None, retries: Optional[int] = None) -> bytes:
+        """
+        Send a request to the device.
+
+        Raises ConnectionError straight away if the device's circuit breaker
+        is open. Failed GETs are retried after a short random delay.
+
+        :param method: HTTP method, either "GET" or "POST".
+        :type method: str
+
+        :param path: Path of the ECP endpoint, e.g. "/query/device-info".
+        :type path: str
+
+        :param timeout: Timeout for this request only, overriding the client's.
+        :type timeout: Optional[float | tuple]
+
+        :param retries: Number of times to retry if the request fails.
+                        Defaults to RETRIES for GETs and 0 for POSTs, which
+                        aren't safe to repeat.
+        :type retries: Optional[int]
+
+        :return: The body of the response.
+        """
+        from requests import RequestException
+
+        if timeout is None:
+            timeout = self.timeout
+        if retries is None:
+            retries = RETRIES if method == "GET" else 0
+
+        self.breaker.check(self.ip)
+        attempt = 0
+        while True:
+            start = perf_counter()
+            try:
+                content = self.session.request(method, self.base_url + path, timeout=timeout).content
+                break
+            except RequestException as e:
+                _run_request_hooks(self.ip, method, path, perf_counter() - start, 0, e)
+                if attempt >= retries:
+                    self.breaker.failure(self.ip)
+                    raise ConnectionError(f"Couldn't connect to Roku device at {self.ip}.") from e
+
+            # random delays keep clients that failed together from retrying together
+            sleep(random.uniform(0, RETRY_DELAY * 2 ** attempt))
+            attempt += 1
+
+        self.breaker.success(self.ip)
+        _run_request_hooks(self.ip, method, path, perf_counter() - start, len(content), None)
+        return content
+
+    def query(self, path: str) -> ElementTree.Element:
+        """
+        Run a query on the device and parse the XML it returns.
+
+        :param path: Path of the query endpoint, e.g. "/query/device-info".
+        :type path: str
+
+        :return: The root element of the response.
+        """
+        return ElementTree.fromstring(self.request("GET", path))
+
+    def device_info(self, cached: bool = True) -> ElementTree.Element:
+        """
+        Get the device's device-info, from the cache if possible.
+
+        :param cached: Whether a cached copy may be used. The fetched document is cached either way.
+        :type cached: bool
+
+        :return: The root element of the device-info document.
+        """
+        if cached:
+            tree = self.cache.get(self.ip)
+            if tree is not None:
+                return tree
+
+        tree = self.query("/query/device-info")
+        self.cache.put(self.ip, tree)
+        return tree
+
+    def get_device(self) -> dict:
+        """
+        Get information about the device. See :func:`get_device`.
+        """
+        return _parse_device(self.ip, self.device_info(cached=False))
+
+    def get_device_info(self, cached: bool = False) -> DeviceInfo:
+        """
+        Get the device's full device-info. See :func:`get_device_info`.
+        """
+        return DeviceInfo.from_element(self.ip, self.device_info(cached))
+
+    def send_key(self, key: str):
+        """
+        Send a keypress to the device. See :func:`send_key`.
+        """
+        self.request("POST", f"/keypress/{key}")
+        if key.startswith("Power"):
+            self.cache.invalidate(self.ip)
+
+    def hold_key(self, key: str, timeout: float = HOLD_TIMEOUT):
+        """
+        Press a key down and keep it held. See :func:`hold_key`.
+        """
+        with self._held_lock:
+            held = self._held.get(key)
+            if held is not None:
+                # renewing only moves the deadline; the timer checks it when it fires
+                held[0] = monotonic() + timeout
+                return
+
+            held = self._held[key] = [monotonic() + timeout, None]
+            self._arm(key, held, timeout)
+
+        try:
+            self.request("POST", f"/keydown/{key}")
+        except ConnectionError:
+            with self._held_lock:
+                if self._held.get(key) is held:
+                    del self._held[key]
+                    held[1].cancel()
+            raise
+
+    def release_key(self, key: str):
+        """
+        Release a key held with :meth:`hold_key`. See :func:`release_key`.
+        """
+        with self._held_lock:
+            held = self._held.pop(key, None)
+            if held is None:
+                return
+            held[1].cancel()
+
+        self.request("POST", f"/keyup/{key}")
+
+    def release_all(self):
+        """
+        Release every key held with :meth:`hold_key`.
+        """
+        with self._held_lock:
+            keys = list(self._held)
+
+        for key in keys:
+            try:
+                self.release_key(key)
+            except ConnectionError:
+                pass
+
+    def _arm(self, key: str, held: list, delay: float):
+        held[1] = Timer(delay, self._expire_key, (key, held))
+        held[1].daemon = True
+        held[1].start()
+
+    def _expire_key(self, key: str, held: list):
+        with self._held_lock:
+            if self._held.get(key) is not held:
+                # released while the timer was firing
+                return
+
+            remaining = held[0] - monotonic()
+            if remaining > 0:
+                self._arm(key, held, remaining)
+                return
+
+        # the key wasn't renewed or released in time, e.g. because the key-up
+        # event was lost; don't leave the device scrolling or changing volume
+        try:
+            self.release_key(key)
+        except ConnectionError:
+            pass
+
+    def toggle_power(self):
+        """
+        Turn the device on or off. See :func:`toggle_power`.
+        """
+        # the power state can change outside controku, e.g. from the remote, so it's never taken from the cache
+        self.send_key(_power_key(self.device_info(cached=False)))
+
+    def search(self, query: str):
+        """
+        Run a search on the device using an already encoded query string.
+        See :func:`search`.
+        """
+        self.request("POST", f"/search/browse?{query}")
+
+    def iter_tv_channels(self) -> Iterator[Channel]:
+        """
+        Stream the device's live TV channels. See :func:`iter_tv_channels`.
+        """
+        from requests import RequestException
+
+        _check_tv(self.device_info())
+
+        path = "/query/tv-channels"
+        self.breaker.check(self.ip)
+        start = perf_counter()
+        size = 0
+        parser = _ChannelParser()
+        try:
+            with self.session.get(self.base_url + path, timeout=self.timeout, stream=True) as response:
+                for chunk in response.iter_content(8192):
+                    size += len(chunk)
+                    yield from parser.feed(chunk)
+        except RequestException as e:
+            _run_request_hooks(self.ip, "GET", path, perf_counter() - start, size, e)
+            self.breaker.failure(self.ip)
+            raise ConnectionError(f"Couldn't connect to Roku device at {self.ip}.") from e
+
+        self.breaker.success(self.ip)
+        _run_request_hooks(self.ip, "GET", path, perf_counter() - start, size, None)
+        yield from parser.close()
+
+    def get_tv_channels(self) -> list:
+        """
+        Get a list of the device's live TV channels. See :func:`get_tv_channels`.
+        """
+        return [channel.as_dict() for channel in self.iter_tv_channels()]
+
+    def get_active_tv_channel(self) -> dict:
+        """
+        Get the device's active live TV channel. See :func:`get_active_tv_channel`.
+        """
+        _check_tv(self.device_info())
+        return _parse_active_tv_channel(self.query("/query/tv-active-channel"))
+
+    def get_media_player(self) -> dict:
+        """
+        Get the state of the device's media player. See :func:`get_media_player`.
+        """
+        return _parse_media_player(self.query("/query/media-player"))
+
+_clients = {}
+_clients_lock = Lock()
+
+def get_client(ip: str) -> RokuClient:
+    """
+    Get the shared client for a Roku device, creating it if needed.
+    The module-level functions all go through these clients, so their
+    connections stay open between calls.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :return: The device's RokuClient.
+    """
+    with _clients_lock:
+        client = _clients.get(ip)
+        if client is None:
+            client = _clients[ip] = RokuClient(ip)
+
+        return client
+
+def iter_devices(timeout: float = 10.0, workers: int = 8, device_timeout: float = 3.0, failed: Optional[list] = None) -> Iterator[dict]:
+    """
+    Discover Roku devices on the local network, yielding each one as soon
+    as its device-info has been fetched.
+
+    Repeated SSDP replies from the same device are ignored, and device-info
+    is fetched for several devices at once. A device that can't be reached
+    is skipped rather than ending the search. If the SSDP search itself
+    fails, e.g. because there's no network, its error is raised.
+
+    :param timeout: Total number of seconds the search may take.
+    :type timeout: float
+
+    :param workers: Maximum number of devices queried at the same time.
+    :type workers: int
+
+    :param device_timeout: Number of seconds to wait for each device to respond.
+    :type device_timeout: float
+
+    :param failed: If given, a dict containing the IP address and the
+                   exception of each device that couldn't be reached is
+                   appended to this list.
+    :type failed: Optional[list]
+
+    :return: An iterator of dicts containing the name, IP address, and UDN of each device found.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from queue import Empty, Queue
+    from ssdpy import SSDPClient
+    from ssdpy.http_helper import parse_headers
+    from ssdpy.protocol import create_msearch_payload
+
+    deadline = monotonic() + timeout
+    events = Queue()
+    pool = ThreadPoolExecutor(max_workers=workers)
+
+    def resolve(ip):
+        client = get_client(ip)
+        tree = ElementTree.fromstring(client.request("GET", "/query/device-info", timeout=device_timeout, retries=0))
+        client.cache.put(ip, tree)
+        return tree
+
+    def search():
+        ssdp = SSDPClient(timeout=min(5, timeout))
+        seen = set()
+        try:
+            ssdp.send(create_msearch_payload(f"{ssdp.broadcast_ip}:{ssdp.port}", "roku:ecp"))
+            for response in ssdp.recv():
+                try:
+                    headers = parse_headers(response)
+                except ValueError:
+                    continue
+
+                location = headers.get('location')
+                if location is None:
+                    continue
+
+                ip = urlparse(location).hostname
+                usn = headers.get('usn', ip)
+                if usn in seen or ip in seen:
+                    continue
+                seen.update((usn, ip))
+
+                events.put(("found", ip, None))
+                pool.submit(resolve, ip).add_done_callback(lambda future, ip=ip: events.put(("resolved", ip, future)))
+                if monotonic() > deadline:
+                    break
+        except Exception as e:
+            # e.g. no network; handed to the caller instead of dying with the thread
+            events.put(("error", None, e))
+        finally:
+            ssdp.sock.close()
+            events.put(("done", None, None))
+
+    Thread(target=search, daemon=True).start()
+
+    pending = set()
+    udns = set()
+    searching = True
+    try:
+        while searching or pending:
+            try:
+                event, ip, future = events.get(timeout=max(0, deadline - monotonic()))
+            except Empty:
+                break
+
+            match event:
+                case "found":
+                    pending.add(ip)
+                case "error":
+                    # the search thread's exception travels in place of a future
+                    raise future
+                case "done":
+                    searching = False
+                case "resolved":
+                    pending.discard(ip)
+                    try:
+                        tree = future.result()
+                    except Exception as e:
+                        if failed is not None:
+                            failed.append({"ip": ip, "error": e})
+                        continue
+
+                    udn = tree.findtext('udn')
+                    if udn is not None:
+                        if udn in udns:
+                            continue
+                        udns.add(udn)
+
+                    yield {"name": tree.findtext('user-device-name'), "ip": ip, "udn": udn}
+
+        if failed is not None:
+            for ip in pending:
+                failed.append({"ip": ip, "error": TimeoutError(f"Roku device at {ip} didn't respond in time.")})
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def discover_devices(timeout: float = 10.0, workers: int = 8, device_timeout: float = 3.0, failed: Optional[list] = None) -> list:
     """
     Discover Roku devices on the local network.
 
-    :return: A list of dicts containing the name and IP address of each device found.
+    Devices that can't be reached are left out of the result instead of
+    raising an error; pass a list as `failed` to find out which they were.
+    The other parameters are described in :func:`iter_devices`.
+
+    :return: A list of dicts containing the name, IP address, and UDN of each device found.
+    """
+    return list(iter_devices(timeout, workers, device_timeout, failed))
+
+def iter_sweep(networks, concurrency: int = 256, probe_timeout: float = 0.5, device_timeout: float = 3.0, failed: Optional[list] = None) -> Iterator[dict]:
+    """
+    Discover Roku devices by trying every address in one or more IP ranges,
+    for networks where SSDP multicast doesn't reach the devices. Each
+    address is first checked for an open ECP port with a quick TCP connect,
+    and device-info is only fetched from addresses that accept it.
+
+    :param networks: A range in CIDR notation, e.g. "10.1.0.0/22", or a
+                     list of them. Overlapping ranges are only swept once.
+    :type networks: str | list
+
+    :param concurrency: Maximum number of addresses probed at the same time.
+    :type concurrency: int
+
+    :param probe_timeout: Number of seconds to wait for each address to accept a connection.
+    :type probe_timeout: float
+
+    :param device_timeout: Number of seconds to wait for each device's device-info.
+    :type device_timeout: float
+
+    :param failed: If given, a dict containing the IP address and the
+                   exception of each address that accepted a connection
+                   but didn't return device-info is appended to this list.
+    :type failed: Optional[list]
+
+    :return: An iterator of dicts containing the name, IP address, and UDN
+             of each device found, like :func:`iter_devices`.
     """
-    search = SSDPClient().m_search("roku:ecp")
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    from ipaddress import collapse_addresses, ip_network
 
-    devices = []
-    for device in search:
-        ip = device['location'][7:-6]
+    if isinstance(networks, str):
+        networks = [networks]
+    networks = list(collapse_addresses(ip_network(network, strict=False) for network in networks))
 
+    def addresses():
+        for network in networks:
+            for address in network.hosts():
+                yield str(address)
+
+    def probe(ip):
         try:
-            info = get(f"http://{ip}:8060/query/device-info").text
-        except:
-            raise ConnectionError("Couldn't connect to Roku device at {ip}.")
+            socket.create_connection((ip, 8060), timeout=probe_timeout).close()
+        except OSError:
+            # nothing listening, which is most addresses
+            return None
+
+        client = get_client(ip)
+        tree = ElementTree.fromstring(client.request("GET", "/query/device-info", timeout=device_timeout, retries=0))
+        if tree.tag != "device-info":
+            raise ValueError(f"{ip} accepted a connection on port 8060 but isn't a Roku device.")
+        client.cache.put(ip, tree)
+        return tree
+
+    queue = addresses()
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    futures = {}
+    udns = set()
+
+    def fill():
+        # addresses are handed out as workers free up, so a large range doesn't fill the memory
+        while len(futures) < 2 * concurrency:
+            ip = next(queue, None)
+            if ip is None:
+                return
+            futures[pool.submit(probe, ip)] = ip
+
+    try:
+        fill()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                ip = futures.pop(future)
+                try:
+                    tree = future.result()
+                except Exception as e:
+                    if failed is not None:
+                        failed.append({"ip": ip, "error": e})
+                    continue
+
+                if tree is None:
+                    continue
+
+                udn = tree.findtext('udn')
+                if udn is not None:
+                    if udn in udns:
+                        continue
+                    udns.add(udn)
+
+                yield {"name": tree.findtext('user-device-name'), "ip": ip, "udn": udn}
+
+            fill()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
 
-        tree = ElementTree.fromstring(info)
-        name = tree.findtext('user-device-name')
-        devices.append({"name": name, "ip": ip})
+def sweep_devices(networks, concurrency: int = 256, probe_timeout: float = 0.5, device_timeout: float = 3.0, failed: Optional[list] = None) -> list:
+    """
+    Discover Roku devices by trying every address in one or more IP ranges.
+    The parameters are described in :func:`iter_sweep`.
 
-    return devices
+    :return: A list of dicts containing the name, IP address, and UDN of each device found.
+    """
+    return list(iter_sweep(networks, concurrency, probe_timeout, device_timeout, failed))
 
 def get_device(ip: str) -> dict:
     """
@@ -36,42 +1109,27 @@ def get_device(ip: str) -> dict:
 
     :return: A dict containing the device's name, IP address, MAC address,
              user-set location, model, serial number, UDN, current resolution,
-             OS version, power state, whether developer mode is enabled or not,
+             OS version, power state (None if unknown), whether developer mode is enabled or not,
              whether the device is a Smart TV or a just a Roku stick/box,
              whether or not it supports Private Listening, and, if so, whether
-             headphones are connected or not.
+             headphones are connected or not, followed by the other fields
+             of :class:`DeviceInfo` such as the raw power mode and uptime.
     """
-    try:
-        info = get(f"http://{ip}:8060/query/device-info").text
-    except:
-        raise ConnectionError("Couldn't connect to Roku device at {ip}.")
-
-    tree = ElementTree.fromstring(info)
-    device = {}
-
-    device['name'] = tree.findtext('user-device-name')
-    device['ip'] = ip
-    device['location'] = tree.findtext('user-device-location')
-
-    match tree.findtext('power-mode'):
-        case "Ready":
-            device['power'] = False
-        case "PowerOn":
-            device['power'] = True
-
-    device['model'] = tree.findtext('friendly-model-name')
-    device['serial'] = tree.findtext('serial-number')
-    device['udn'] = tree.findtext('udn')
-    device['resolution'] = tree.findtext('ui-resolution')
-    device['mac'] = tree.findtext('wifi-mac')
-    device['software'] = tree.findtext('software-version')
-    device['tv'] = tree.findtext('is-tv') == "true"
-    device['stick'] = tree.findtext('is-stick') == "true"
-    device['devmode'] = tree.findtext('developer-enabled') == "true"
-    device['netsound'] = tree.findtext('supports-private-listening') == "true"
-    device['headphones'] = tree.findtext('headphones-connected') == "true"
-
-    return device
+    return get_client(ip).get_device()
+
+def get_device_info(ip: str, cached: bool = False) -> DeviceInfo:
+    """
+    Get everything a Roku device reports about itself, as a DeviceInfo record.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param cached: Whether a copy from the last few seconds may be used.
+    :type cached: bool
+
+    :return: The DeviceInfo record.
+    """
+    return get_client(ip).get_device_info(cached)
 
 def send_key(ip: str, key: str):
     """
@@ -83,10 +1141,38 @@ def send_key(ip: str, key: str):
     :param key: Key to send to the device. Common values are seen here: https://developer.roku.com/docs/developer-program/debugging/external-control-api.md#keypress-key-values
     :type key: str
     """
-    try:
-        post(f"http://{ip}:8060/keypress/{key}")
-    except:
-        raise ConnectionError("Couldn't connect to Roku device at {ip}.")
+    get_client(ip).send_key(key)
+
+def hold_key(ip: str, key: str, timeout: float = HOLD_TIMEOUT):
+    """
+    Press a key down on a Roku device and keep it held, like holding a
+    button on the remote, until :func:`release_key` is called. Holding a key
+    that's already held only renews it, without sending anything, so this
+    can be called on every auto-repeat event. If a held key isn't renewed or
+    released within `timeout` seconds, it's released automatically.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param key: Key to hold, e.g. "VolumeUp" or "Right". See :func:`send_key`.
+    :type key: str
+
+    :param timeout: Seconds before the key is released unless it's renewed.
+    :type timeout: float
+    """
+    get_client(ip).hold_key(key, timeout)
+
+def release_key(ip: str, key: str):
+    """
+    Release a key held with :func:`hold_key`. Nothing is sent if the key isn't held.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param key: Key to release.
+    :type key: str
+    """
+    get_client(ip).release_key(key)
 
 def toggle_power(ip: str):
     """
@@ -95,20 +1181,7 @@ def toggle_power(ip: str):
     :param ip: IP address of the device.
     :type ip: str
     """
-    try:
-        info = get(f"http://{ip}:8060/query/device-info").text
-    except:
-        raise ConnectionError("Couldn't connect to Roku device at {ip}.")
-
-    tree = ElementTree.fromstring(info)
-    mode = tree.findtext('power-mode')
-    match mode:
-        case "Ready":
-            send_key(ip, "PowerOn")
-        case "PowerOn":
-            send_key(ip, "PowerOff")
-        case _:
-            raise ValueError("Roku is in unknown power state.")
+    get_client(ip).toggle_power()
 
 def search(ip: str, keyword: str, title: Optional[str] = None, type: Optional[str] = None, tmsid: Optional[str] = None, season: Optional[int] = None, unavailable: Optional[bool] = None, matchany: Optional[bool] = None, providerid: Optional[str] = None, provider: Optional[str] = None, launch: Optional[bool] = None):
     """
@@ -147,30 +1220,20 @@ def search(ip: str, keyword: str, title: Optional[str] = None, type: Optional[st
     :param launch: Automatically launch the channel in which content was found.
     :type launch: Optional[bool]
     """
-    options = ["keyword", "title", "type", "tmsid", "season", "unavailable", "matchany", "providerid", "provider", "launch"]
-    selected_options = []
-    for option in options:
-        if locals()[option] is not None:
-            if option == "type":
-                if type not in ["movie", "tv-show", "person", "channel", "game"]:
-                    raise ValueError("`type` must be one of 'movie', 'tv-show', 'person', 'channel', or 'game'.")
+    get_client(ip).search(_search_query(keyword, title, type, tmsid, season, unavailable, matchany, providerid, provider, launch))
 
-            selected_options.append({"name": option, "value": locals()[option]})
-
-    query = ""
-    for option in selected_options:
-        if option['value'] == True:
-            option['value'] == "true"
-        elif option['value'] == False:
-            option['value'] == "false"
+def iter_tv_channels(ip: str) -> Iterator[Channel]:
+    """
+    Stream the live TV channels available on a Roku device. The lineup is
+    parsed as it arrives, and each channel is yielded as soon as it has been
+    read, so large lineups are never held in memory all at once.
 
-        query += f"{option['name']}={option['value']}&"
+    :param ip: IP address of the device.
+    :type ip: str
 
-    query = quote(query[:-1], safe="/=&")
-    try:
-        post(f"http://{ip}:8060/search/browse?{query}")
-    except:
-        raise ConnectionError("Couldn't connect to Roku device at {ip}.")
+    :return: An iterator of Channel records.
+    """
+    return get_client(ip).iter_tv_channels()
 
 def get_tv_channels(ip: str) -> list:
     """
@@ -186,32 +1249,7 @@ def get_tv_channels(ip: str) -> list:
              "virtual" channel number), and whether or not the user has
              hidden the channel or listed it as a favorite.
     """
-    try:
-        info = get(f"http://{ip}:8060/query/device-info").text
-    except:
-        raise ConnectionError("Couldn't connect to Roku device at {ip}.")
-
-    infotree = ElementTree.fromstring(info)
-    if infotree.findtext('is-tv') != "true":
-        raise ValueError("This Roku device is not a TV.")
-
-    try:
-        xml = get(f"http://{ip}:8060/query/tv-channels").text
-    except:
-        raise ConnectionError("Couldn't connect to Roku device at {ip}.")
-
-    tree = ElementTree.fromstring(xml)
-    channels = []
-    for channel in tree:
-        name = channel.findtext('name')
-        number = channel.findtext('number')
-        type = channel.findtext('type')
-        realchannel = channel.findtext('physical-channel')
-        hidden = channel.findtext('user-hidden')
-        favorite = channel.findtext('user-favorite')
-        channels.append({"name": name, "number": number, "type": type, "channel": realchannel, "hidden": hidden, "favorite": favorite})
-
-    return channels
+    return get_client(ip).get_tv_channels()
 
 def get_active_tv_channel(ip: str) -> dict:
     """
@@ -229,40 +1267,18 @@ def get_active_tv_channel(ip: str) -> dict:
              currently playing, and the title, description, and rating
              of its current program.
     """
-    try:
-        info = get(f"http://{ip}:8060/query/device-info").text
-    except:
-        raise ConnectionError("Couldn't connect to Roku device at {ip}.")
-
-    infotree = ElementTree.fromstring(info)
-    if infotree.findtext('is-tv') != "true":
-        raise ValueError("This Roku device is not a TV.")
+    return get_client(ip).get_active_tv_channel()
 
-    try:
-        xml = get(f"http://{ip}:8060/query/tv-active-channel").text
-    except:
-        raise ConnectionError("Couldn't connect to Roku device at {ip}.")
-
-    tree = ElementTree.fromstring(xml)[0]
-    channel = {}
-    channel['name'] = tree.findtext('name')
-    channel['number'] = tree.findtext('number')
-    channel['type'] = tree.findtext('type')
-    channel['channel'] = tree.findtext('physical-channel')
-    channel['hidden'] = tree.findtext('user-hidden')
-    channel['favorite'] = tree.findtext('user-favorite')
-    channel['active'] = tree.findtext('active-input') == "true"
-
-    match tree.findtext('signal-state'):
-        case "valid":
-            channel['signal'] = True
-        case "none":
-            channel['signal'] = False
+def get_media_player(ip: str) -> dict:
+    """
+    Get the state of a Roku device's media player.
 
-    channel['resolution'] = tree.findtext('signal-mode')
-    channel['title'] = tree.findtext('program-title')
-    channel['description'] = tree.findtext('program-description')
-    channel['rating'] = tree.findtext('program-ratings')
-    channel['captions'] = tree.findtext('program-has-cc') == "true"
+    :param ip: IP address of the device.
+    :type ip: str
 
-    return channel
+    :return: A dict containing the player's state (such as "play", "pause",
+             "buffer", "stop", or "close"), whether it has an error, the
+             name and ID of the app that's playing, the playback position
+             and duration in milliseconds, and whether the stream is live.
+    """
+    return get_client(ip).get_media_player()
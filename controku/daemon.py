@@ -0,0 +1,180 @@
+"""
+A long-running controku process that other programs talk to over a Unix
+domain socket, so that they don't pay for Python start-up, imports and a
+new connection to the device on every command.
+
+The protocol is line-oriented JSON. Each request is an object containing
+the command's name and optionally its "args" and "kwargs", e.g.
+{"command": "send_key", "args": ["192.168.1.20", "Home"]}, and each
+response is either {"ok": true, "result": ...} or
+{"ok": false, "error": "ConnectionError", "message": "..."}.
+"""
+import json
+import os
+import socket
+from typing import Optional
+
+# Commands the daemon accepts, and the controku module each one comes from
+COMMANDS = {
+    "send_key": "controku.controku",
+    "send_keys": "controku.macro",
+    "send_text": "controku.macro",
+    "toggle_power": "controku.controku",
+    "get_device": "controku.controku",
+    "get_tv_channels": "controku.controku",
+    "get_active_tv_channel": "controku.controku",
+    "search": "controku.controku",
+    "discover_devices": "controku.controku",
+    "sweep_devices": "controku.controku",
+    "tune": "controku.channels",
+    "get_apps": "controku.apps",
+    "get_active_app": "controku.apps",
+    "find_app": "controku.apps",
+    "launch_app": "controku.apps",
+}
+
+# Exceptions re-raised as themselves by DaemonClient; others become RuntimeError
+ERRORS = {"ConnectionError": ConnectionError, "TimeoutError": TimeoutError, "ValueError": ValueError}
+
+def default_socket_path() -> str:
+    """
+    :return: The path of the daemon's socket, in $XDG_RUNTIME_DIR if it's set.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "controku.sock")
+
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), f"controku-{os.getuid()}.sock")
+
+def _encode(value) -> str:
+    return json.dumps(value, default=lambda value: value.as_dict() if hasattr(value, "as_dict") else str(value))
+
+def serve(path: Optional[str] = None, warm: bool = True):
+    """
+    Run the daemon until interrupted. A stale socket left behind by a daemon
+    that didn't exit cleanly is replaced, but if another daemon is still
+    listening on it, a RuntimeError is raised instead.
+
+    :param path: Path of the socket to listen on. Defaults to :func:`default_socket_path`.
+    :type path: Optional[str]
+
+    :param warm: Whether to open connections to every remembered device at start.
+    :type warm: bool
+    """
+    import controku
+    from importlib import import_module
+    from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+    from threading import Thread
+
+    functions = {name: getattr(import_module(module), name) for name, module in COMMANDS.items()}
+
+    class Handler(StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                    function = functions.get(request.get('command')) if isinstance(request, dict) else None
+                    if function is None:
+                        response = {"ok": False, "error": "ValueError", "message": "Unknown or malformed command."}
+                    else:
+                        response = {"ok": True, "result": function(*request.get("args", []), **request.get("kwargs", {}))}
+                except Exception as e:
+                    response = {"ok": False, "error": type(e).__name__, "message": str(e)}
+
+                self.wfile.write(_encode(response).encode() + b"\n")
+
+    path = default_socket_path() if path is None else path
+    running = connect(path)
+    if running is not None:
+        running.close()
+        raise RuntimeError(f"A controku daemon is already running at {path}.")
+    if os.path.exists(path):
+        os.unlink(path)
+
+    server = ThreadingUnixStreamServer(path, Handler)
+    server.daemon_threads = True
+    os.chmod(path, 0o600)
+
+    if warm:
+        def warm_up():
+            from controku.registry import DeviceRegistry
+            for device in DeviceRegistry():
+                if device['ip'] is None:
+                    continue
+                try:
+                    controku.get_client(device['ip']).device_info(cached=False)
+                except ConnectionError:
+                    pass
+
+        Thread(target=warm_up, daemon=True).start()
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+class DaemonClient:
+    """
+    A connection to a running controku daemon.
+
+    :param path: Path of the daemon's socket. Defaults to :func:`default_socket_path`.
+    :type path: Optional[str]
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(default_socket_path() if path is None else path)
+        self.file = self.sock.makefile("rwb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Close the connection to the daemon.
+        """
+        self.file.close()
+        self.sock.close()
+
+    def call(self, command: str, *args, **kwargs):
+        """
+        Run a command in the daemon.
+
+        :param command: Name of the command, one of those in COMMANDS.
+        :type command: str
+
+        Any other arguments are passed on to the command.
+
+        :return: The command's result, decoded from JSON.
+        """
+        self.file.write(_encode({"command": command, "args": args, "kwargs": kwargs}).encode() + b"\n")
+        self.file.flush()
+
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("The controku daemon closed the connection.")
+
+        response = json.loads(line)
+        if not response['ok']:
+            raise ERRORS.get(response['error'], RuntimeError)(response['message'])
+
+        return response['result']
+
+def connect(path: Optional[str] = None) -> Optional[DaemonClient]:
+    """
+    Connect to the daemon if it's running.
+
+    :param path: Path of the daemon's socket. Defaults to :func:`default_socket_path`.
+    :type path: Optional[str]
+
+    :return: A DaemonClient, or None if no daemon is listening.
+    """
+    try:
+        return DaemonClient(path)
+    except (OSError, AttributeError):
+        # AttributeError: no Unix domain sockets on this platform
+        return None
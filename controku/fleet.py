@@ -0,0 +1,265 @@
+import argparse
+import json
+import sys
+import controku
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from threading import Thread
+from time import monotonic
+from typing import Callable, Iterable, Iterator, Union
+
+def _operation(operation: Union[str, Callable]) -> Callable:
+    if callable(operation):
+        return operation
+
+    function = getattr(controku, operation, None)
+    if not callable(function):
+        raise ValueError(f"`{operation}` is not a controku function.")
+
+    return function
+
+def _unique(ips: Iterable) -> Iterator[str]:
+    seen = set()
+    for ip in ips:
+        if ip not in seen:
+            seen.add(ip)
+            yield ip
+
+def _start(function: Callable, *args, **kwargs) -> Future:
+    # run a function on its own thread, so one that never returns only ties up that thread
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    Thread(target=run, daemon=True).start()
+    return future
+
+def iter_broadcast(ips: Iterable, operation: Union[str, Callable], *args, concurrency: int = 32, timeout: float = 10.0, **kwargs) -> Iterator[dict]:
+    """
+    Run an operation on several Roku devices at once, yielding each
+    device's result as soon as it finishes.
+
+    Devices are taken from `ips` only as workers become free, so it can be
+    a generator, and the memory used doesn't grow with the number of devices.
+    A device that times out frees its worker right away, even though its
+    operation may still be running in the background.
+
+    :param ips: IP addresses of the devices.
+    :type ips: Iterable
+
+    :param operation: Either a function taking the device's IP address as
+                      its first argument, or the name of one of controku's
+                      functions, such as "send_key" or "toggle_power".
+    :type operation: str | Callable
+
+    :param concurrency: Maximum number of devices handled at the same time.
+    :type concurrency: int
+
+    :param timeout: Number of seconds each device is given to finish,
+                    counted from when its operation starts.
+    :type timeout: float
+
+    Any other arguments are passed on to the operation.
+
+    :return: An iterator of dicts containing each device's IP address,
+             the operation's return value, the exception it raised (or
+             None), and how many seconds it took.
+    """
+    function = _operation(operation)
+    starts = {}
+    queue = _unique(ips)
+    futures = {}
+
+    def fill():
+        while len(futures) < concurrency:
+            ip = next(queue, None)
+            if ip is None:
+                return
+            starts[ip] = monotonic()
+            futures[_start(function, ip, *args, **kwargs)] = ip
+
+    fill()
+    while futures:
+        wait_time = max(0, min(starts.values()) + timeout - monotonic())
+        done, _ = wait(futures, timeout=wait_time, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            ip = futures.pop(future)
+            latency = monotonic() - starts.pop(ip)
+            try:
+                yield {"ip": ip, "result": future.result(), "error": None, "latency": latency}
+            except Exception as e:
+                yield {"ip": ip, "result": None, "error": e, "latency": latency}
+
+        now = monotonic()
+        for future, ip in list(futures.items()):
+            if now - starts[ip] >= timeout:
+                # abandoned; its thread finishes on its own without holding up the others
+                del futures[future]
+                yield {"ip": ip, "result": None, "error": TimeoutError(f"Roku device at {ip} didn't finish in time."), "latency": now - starts.pop(ip)}
+
+        fill()
+
+def broadcast(ips: list, operation: Union[str, Callable], *args, concurrency: int = 32, timeout: float = 10.0, **kwargs) -> list:
+    """
+    Run an operation on several Roku devices at once. The parameters are
+    described in :func:`iter_broadcast`.
+
+    :return: A list of result dicts, in the same order as `ips`.
+    """
+    results = {result['ip']: result for result in iter_broadcast(ips, operation, *args, concurrency=concurrency, timeout=timeout, **kwargs)}
+    return [results[ip] for ip in dict.fromkeys(ips)]
+
+# Columns of an inventory record, in the order they're written to CSV
+INVENTORY_FIELDS = [
+    "ip", "name", "location", "power", "power_mode", "model", "serial", "udn", "resolution", "mac", "software", "uptime",
+    "tv", "stick", "devmode", "netsound", "headphones",
+    "channel_number", "channel_name", "program",
+    "error", "latency",
+]
+
+def _inventory(ip: str, channel: bool) -> dict:
+    record = controku.get_device(ip)
+    if channel and record['tv']:
+        try:
+            active = controku.get_active_tv_channel(ip)
+        except IndexError:
+            # not on a live TV input
+            pass
+        except ConnectionError as e:
+            # keep what was already collected about the device
+            record['error'] = f"active channel: {e}"
+        else:
+            record['channel_number'] = active['number']
+            record['channel_name'] = active['name']
+            record['program'] = active['title']
+
+    return record
+
+def iter_inventory(ips: Iterable, channel: bool = False, concurrency: int = 32, timeout: float = 10.0) -> Iterator[dict]:
+    """
+    Collect information about several Roku devices at once, yielding each
+    device's record as soon as it's ready. A device that fails doesn't
+    stop the others; its record has only its IP address and the error.
+
+    :param ips: IP addresses of the devices. Like in :func:`iter_broadcast`,
+                it can be a generator.
+    :type ips: Iterable
+
+    :param channel: Whether to also get the active live TV channel of each TV.
+    :type channel: bool
+
+    :param concurrency: Maximum number of devices handled at the same time.
+    :type concurrency: int
+
+    :param timeout: Number of seconds each device is given to answer.
+    :type timeout: float
+
+    :return: An iterator of dicts with the keys in INVENTORY_FIELDS: the
+             fields returned by :func:`controku.get_device`, the active
+             channel's number and name and the program showing (None if
+             not requested or not a TV), an error message (None if
+             everything succeeded), and the seconds the device took.
+    """
+    for result in iter_broadcast(ips, _inventory, channel, concurrency=concurrency, timeout=timeout):
+        record = dict.fromkeys(INVENTORY_FIELDS)
+        if result['error'] is None:
+            # only the inventory's own fields, so every record has the same keys
+            for field in INVENTORY_FIELDS:
+                record[field] = result['result'].get(field)
+        else:
+            record['error'] = str(result['error'])
+        record['ip'] = result['ip']
+        record['latency'] = round(result['latency'], 4)
+        yield record
+
+def write_inventory(records: Iterable, file, format: str = "jsonl") -> tuple:
+    """
+    Write inventory records to a file as they arrive, flushing after each
+    one, so that a long run can be watched or interrupted without losing
+    what was already collected.
+
+    :param records: Records from :func:`iter_inventory`.
+    :type records: Iterable
+
+    :param file: A text file open for writing.
+
+    :param format: Either "jsonl" for one JSON object per line, or "csv".
+    :type format: str
+
+    :return: A tuple of the number of records written and how many of them have an error.
+    """
+    match format:
+        case "jsonl":
+            write = lambda record: file.write(json.dumps(record) + "\n")
+        case "csv":
+            import csv
+            writer = csv.DictWriter(file, INVENTORY_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            write = writer.writerow
+        case _:
+            raise ValueError(f"Unknown inventory format `{format}`.")
+
+    count = failures = 0
+    for record in records:
+        write(record)
+        file.flush()
+        count += 1
+        failures += record['error'] is not None
+
+    return count, failures
+
+# Operations available from the command line, and the controku function each one runs
+COMMANDS = {
+    "key": "send_key",
+    "keys": "send_keys",
+    "power": "toggle_power",
+    "info": "get_device",
+    "channel": "get_active_tv_channel",
+}
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m controku.fleet", description="Run a controku command on several Roku devices at once.")
+    parser.add_argument("-d", "--device", action="append", default=[], help="IP address of a device; can be given more than once")
+    parser.add_argument("-f", "--file", help="file listing one device IP address per line")
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="maximum number of devices handled at once (default: 32)")
+    parser.add_argument("-t", "--timeout", type=float, default=10.0, help="seconds each device is given to finish (default: 10)")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per device")
+    parser.add_argument("command", choices=COMMANDS, help="command to run")
+    parser.add_argument("args", nargs="*", help="arguments of the command, e.g. the key to send")
+    args = parser.parse_args()
+
+    ips = list(args.device)
+    if args.file is not None:
+        with open(args.file) as file:
+            ips += [line.strip() for line in file if line.strip() and not line.startswith("#")]
+    if not ips:
+        parser.error("no devices given; use --device or --file")
+
+    command_args = [args.args] if args.command == "keys" else args.args
+    failures = 0
+    for result in iter_broadcast(ips, COMMANDS[args.command], *command_args, concurrency=args.concurrency, timeout=args.timeout):
+        failures += result['error'] is not None
+        if args.json:
+            error = None if result['error'] is None else str(result['error'])
+            print(json.dumps({"ip": result['ip'], "result": result['result'], "error": error, "latency": round(result['latency'], 4)}, default=str), flush=True)
+        elif result['error'] is None:
+            # commands like info and channel are run for what they return, so show it under the device
+            lines = [f"{result['ip']}: ok ({result['latency'] * 1000:.0f} ms)"]
+            if isinstance(result['result'], dict):
+                lines += [f"    {name}: {value}" for name, value in result['result'].items()]
+            elif result['result'] is not None:
+                lines.append(f"    {result['result']}")
+            print("\n".join(lines), flush=True)
+        else:
+            print(f"{result['ip']}: {result['error']} ({result['latency'] * 1000:.0f} ms)", flush=True)
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
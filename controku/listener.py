@@ -0,0 +1,195 @@
+import logging
+import socket
+import struct
+from controku.controku import get_client
+from ssdpy.http_helper import parse_headers
+from ssdpy.protocol import create_msearch_payload
+from threading import Lock, Thread
+from time import monotonic
+from typing import Callable
+from urllib.parse import urlparse
+from xml.etree import ElementTree
+
+_log = logging.getLogger(__name__)
+
+SSDP_ADDRESS = "239.255.255.250"
+
+class DeviceListener:
+    """
+    Keeps a live table of the Roku devices on the local network by listening
+    for the SSDP NOTIFY messages they multicast when they come online, renew
+    their announcement, or leave.
+
+    Subscribers are called with an event and the device it's about. The
+    events are "add" when a device appears, "remove" when it says goodbye or
+    its announcement expires, and "moved" when it comes back with a new IP
+    address. Devices are dicts containing the name, IP address, UDN and USN
+    of the device. Subscribers are called on the listener's thread.
+
+    :param port: UDP port to listen on.
+    :type port: int
+
+    :param search: Whether to send one M-SEARCH when starting, so devices
+                   that are already online show up without waiting for
+                   their next announcement.
+    :type search: bool
+
+    :param device_timeout: Number of seconds to wait for a new device's device-info.
+    :type device_timeout: float
+    """
+    def __init__(self, port: int = 1900, search: bool = True, device_timeout: float = 3.0):
+        self.port = port
+        self.search = search
+        self.device_timeout = device_timeout
+        self.devices = {}
+        self._expires = {}
+        self._subscribers = []
+        self._lock = Lock()
+        self._sock = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def subscribe(self, callback: Callable):
+        """
+        Call a function on every event.
+
+        :param callback: Function taking the event name and the device dict.
+        :type callback: Callable
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable):
+        """
+        Stop calling a function added with :meth:`subscribe`.
+        """
+        self._subscribers.remove(callback)
+
+    def start(self):
+        """
+        Start listening on a background thread.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("", self.port))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, struct.pack("4s4s", socket.inet_aton(SSDP_ADDRESS), socket.inet_aton("0.0.0.0")))
+        sock.settimeout(1)
+        self._sock = sock
+
+        if self.search:
+            sock.sendto(create_msearch_payload(f"{SSDP_ADDRESS}:{self.port}", "roku:ecp"), (SSDP_ADDRESS, self.port))
+
+        Thread(target=self._listen, args=(sock,), daemon=True).start()
+
+    def stop(self):
+        """
+        Stop listening.
+        """
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _emit(self, event: str, device: dict):
+        for callback in list(self._subscribers):
+            try:
+                callback(event, device)
+            except Exception:
+                _log.exception("Error in device listener subscriber")
+
+    def _listen(self, sock: socket.socket):
+        while self._sock is sock:
+            try:
+                data = sock.recv(2048)
+            except socket.timeout:
+                self._expire()
+                continue
+            except OSError:
+                return
+
+            try:
+                headers = parse_headers(data)
+            except ValueError:
+                continue
+
+            if data.startswith(b"NOTIFY"):
+                if headers.get('nt') != "roku:ecp":
+                    continue
+                alive = headers.get('nts') != "ssdp:byebye"
+            elif data.startswith(b"HTTP/1.1 200 OK"):
+                if headers.get('st') != "roku:ecp":
+                    continue
+                alive = True
+            else:
+                continue
+
+            usn = headers.get('usn')
+            if usn is None:
+                continue
+
+            if alive:
+                self._alive(usn, headers)
+            else:
+                self._byebye(usn)
+
+            self._expire()
+
+    def _max_age(self, headers: dict) -> float:
+        for directive in headers.get('cache-control', "").split(","):
+            name, _, value = directive.strip().partition("=")
+            if name.lower() == "max-age" and value.isdigit():
+                return int(value)
+
+        return 1800
+
+    def _alive(self, usn: str, headers: dict):
+        location = headers.get('location')
+        if location is None:
+            return
+
+        ip = urlparse(location).hostname
+        with self._lock:
+            self._expires[usn] = monotonic() + self._max_age(headers)
+            device = self.devices.get(usn)
+            if device is not None and device['ip'] == ip:
+                return
+
+        if device is not None:
+            device = dict(device, ip=ip)
+            with self._lock:
+                self.devices[usn] = device
+            self._emit("moved", device)
+            return
+
+        try:
+            client = get_client(ip)
+            tree = ElementTree.fromstring(client.request("GET", "/query/device-info", timeout=self.device_timeout, retries=0))
+            client.cache.put(ip, tree)
+        except (ConnectionError, ElementTree.ParseError):
+            with self._lock:
+                self._expires.pop(usn, None)
+            return
+
+        device = {"name": tree.findtext('user-device-name'), "ip": ip, "udn": tree.findtext('udn'), "usn": usn}
+        with self._lock:
+            self.devices[usn] = device
+        self._emit("add", device)
+
+    def _byebye(self, usn: str):
+        with self._lock:
+            self._expires.pop(usn, None)
+            device = self.devices.pop(usn, None)
+
+        if device is not None:
+            self._emit("remove", device)
+
+    def _expire(self):
+        now = monotonic()
+        with self._lock:
+            expired = [usn for usn, expires in self._expires.items() if expires < now]
+
+        for usn in expired:
+            self._byebye(usn)
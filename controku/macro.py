@@ -0,0 +1,154 @@
+from controku.controku import get_client
+from time import monotonic, sleep
+from urllib.parse import quote
+
+def parse_macro(text: str) -> list:
+    """
+    Parse a macro into a list of steps.
+
+    A macro has one step per line. A step is either the name of a key to
+    send, optionally followed by `xN` to send it N times, or `wait` followed
+    by a number of seconds to pause. Blank lines and lines starting with `#`
+    are ignored. For example::
+
+        # open the live TV guide
+        Home
+        Down x3
+        Select
+        wait 1.5
+        Right
+
+    :param text: The macro to parse.
+    :type text: str
+
+    :return: A list of ("key", name) and ("wait", seconds) tuples.
+    """
+    steps = []
+    for number, line in enumerate(text.splitlines(), 1):
+        words = line.split("#", 1)[0].split()
+        if not words:
+            continue
+
+        if words[0].lower() == "wait":
+            if len(words) != 2:
+                raise ValueError(f"Line {number}: `wait` takes exactly one argument.")
+            try:
+                steps.append(("wait", float(words[1])))
+            except ValueError:
+                raise ValueError(f"Line {number}: `{words[1]}` is not a number of seconds.")
+            continue
+
+        repeat = 1
+        if len(words) == 2 and words[1][0] in "xX" and words[1][1:].isdigit():
+            repeat = int(words[1][1:])
+        elif len(words) != 1:
+            raise ValueError(f"Line {number}: expected a key name, optionally followed by xN.")
+
+        steps.extend([("key", words[0])] * repeat)
+
+    return steps
+
+def load_macro(path: str) -> list:
+    """
+    Read and parse a macro file. See :func:`parse_macro` for the format.
+
+    :param path: Path of the macro file.
+    :type path: str
+
+    :return: A list of ("key", name) and ("wait", seconds) tuples.
+    """
+    with open(path) as file:
+        return parse_macro(file.read())
+
+def send_keys(ip: str, sequence, gap: float = 0.0) -> list:
+    """
+    Send a sequence of keypresses to a Roku device over one connection.
+
+    Keys are sent back to back, each as soon as the device has accepted
+    the previous one, unless a minimum gap between them is set.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param sequence: Either a list of key names, or a list of steps returned by :func:`parse_macro`.
+    :type sequence: list
+
+    :param gap: Minimum number of seconds between the start of one keypress and the next.
+    :type gap: float
+
+    :return: A list of dicts containing each step's kind ("key" or "wait"),
+             value, start time relative to the start of the sequence, and
+             duration, all in seconds.
+    """
+    client = get_client(ip)
+    timings = []
+    start = monotonic()
+    last_key = None
+
+    for step in sequence:
+        kind, value = ("key", step) if isinstance(step, str) else step
+
+        if kind == "wait":
+            began = monotonic()
+            sleep(value)
+        elif kind == "key":
+            if last_key is not None and gap > 0:
+                remaining = last_key + gap - monotonic()
+                if remaining > 0:
+                    sleep(remaining)
+
+            began = last_key = monotonic()
+            client.send_key(value)
+        else:
+            raise ValueError(f"Unknown macro step `{kind}`.")
+
+        timings.append({"kind": kind, "value": value, "start": began - start, "duration": monotonic() - began})
+
+    return timings
+
+def text_keys(text: str, sent: str = "") -> list:
+    """
+    Work out the keys that turn text already typed on a Roku device into new text.
+
+    The on-screen keyboard only types and deletes at the end of the text, so
+    everything after the first difference is deleted with Backspace and then
+    typed again.
+
+    :param text: The text that should be on the device.
+    :type text: str
+
+    :param sent: The text that has already been typed on the device.
+    :type sent: str
+
+    :return: A list of key names, e.g. ["Backspace", "Lit_a"].
+    """
+    common = 0
+    for old, new in zip(sent, text):
+        if old != new:
+            break
+        common += 1
+
+    return ["Backspace"] * (len(sent) - common) + ["Lit_" + quote(character, safe="") for character in text[common:]]
+
+def send_text(ip: str, text: str, sent: str = "") -> list:
+    """
+    Type text on a Roku device, e.g. into a search box, over one connection.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param text: The text to type.
+    :type text: str
+
+    :param sent: Text that has already been typed, which is corrected
+                 rather than typed again. See :func:`text_keys`.
+    :type sent: str
+
+    :return: The keys that were sent.
+    """
+    keys = text_keys(text, sent)
+    client = get_client(ip)
+    for key in keys:
+        client.send_key(key)
+
+    return keys
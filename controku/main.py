@@ -3,15 +3,153 @@ import gi
 import sys
 gi.require_version("Gtk", "3.0")
 from appdirs import user_cache_dir
-from gi.repository import Gtk
-from json import dump, load
+from collections import deque
+from controku.listener import DeviceListener
+from controku.registry import DeviceRegistry
+from gi.repository import GLib, Gtk
 from os import path, makedirs
-from urllib.parse import quote
+from threading import Condition, Thread
+from urllib.parse import unquote
+
+class CommandWorker:
+    """
+    Runs controku calls off the GTK main loop. Each device gets its own
+    queue and thread, so commands to one device stay in order while a slow
+    or offline device can't hold up the UI or any other device. Results are
+    handed back to the main loop with GLib.idle_add.
+    """
+    def __init__(self):
+        self.queues = {}
+        self.condition = Condition()
+
+    def submit(self, queue, function, *args, callback=None, coalesce=False):
+        """
+        Queue a call to function(*args).
+
+        :param queue: Name of the queue to run the call on, usually the device's IP address.
+        :param callback: Called on the main loop with the function's return value.
+        :param coalesce: Drop the call if an identical one is already waiting
+                         at the end of the queue, e.g. for auto-repeated keys.
+        """
+        job = (function, args, callback)
+        with self.condition:
+            jobs = self.queues.get(queue)
+            if jobs is None:
+                jobs = self.queues[queue] = deque()
+                Thread(target=self.run, args=(jobs,), daemon=True).start()
+
+            if coalesce and jobs and jobs[-1][:2] == job[:2]:
+                return
+
+            jobs.append(job)
+            self.condition.notify_all()
+
+    def run(self, jobs):
+        while True:
+            with self.condition:
+                while not jobs:
+                    self.condition.wait()
+                function, args, callback = jobs.popleft()
+
+            try:
+                result = function(*args)
+            except Exception as e:
+                GLib.idle_add(self.report_error, e)
+                continue
+
+            if callback is not None:
+                GLib.idle_add(callback, result)
+
+    def report_error(self, error):
+        print(error, file=sys.stderr)
+
+def remote_key(keyval: int):
+    """
+    Get the Roku key a keyboard key is mapped to.
+
+    :param keyval: The GDK key value.
+    :return: The name of the Roku key, or None if the key isn't mapped.
+    """
+    match keyval:
+        case 65288:
+            return "Back"
+        case 98:
+            return "Back"
+        case 65307:
+            return "Home"
+        case 104:
+            return "Home"
+        case 105:
+            return "Info"
+        case 65361:
+            return "Left"
+        case 97:
+            return "Left"
+        case 65362:
+            return "Up"
+        case 119:
+            return "Up"
+        case 65363:
+            return "Right"
+        case 100:
+            return "Right"
+        case 65364:
+            return "Down"
+        case 115:
+            return "Down"
+        case 65293:
+            return "Select"
+        case 32:
+            return "Select"
+        case 111:
+            return "Select"
+        case 114:
+            return "Rev"
+        case 44:
+            return "Rev"
+        case 102:
+            return "Fwd"
+        case 46:
+            return "Fwd"
+        case 112:
+            return "Play"
+        case 47:
+            return "Play"
+        case 109:
+            return "VolumeMute"
+        case 92:
+            return "VolumeMute"
+        case 91:
+            return "VolumeDown"
+        case 45:
+            return "VolumeDown"
+        case 93:
+            return "VolumeUp"
+        case 61:
+            return "VolumeUp"
+        case 43:
+            return "VolumeUp"
+        case _:
+            return None
+
+class Session:
+    """
+    A device open in the remote. Sessions keep the last device info they
+    got, and their devices keep their connections open (see
+    controku.get_client), so switching between them sends no requests.
+    """
+    def __init__(self, key, info):
+        self.key = key
+        self.info = info
+        self.ip = info['ip']
+        self.radio = None
+        self.check = None
+        self.box = None
 
 class Window(Gtk.Window):
     def __init__(self):
         global device_ip
-        global cached_devices
+        global registry
         global cache_path
 
         if len(sys.argv) >= 2:
@@ -21,11 +159,7 @@ class Window(Gtk.Window):
 
         cache_path = user_cache_dir("controku", "benthetechguy")
         makedirs(cache_path, exist_ok=True)
-        if path.isfile(path.join(cache_path, "devices.json")):
-            with open(path.join(cache_path, "devices.json")) as file:
-                cached_devices = load(file)
-        else:
-            cached_devices = []
+        registry = DeviceRegistry(path.join(cache_path, "devices.json"))
 
         super().__init__(title="Controku")
         self.set_border_width(10)
@@ -39,9 +173,27 @@ class Window(Gtk.Window):
         Gtk.IconTheme.get_default().append_search_path(path.join(basepath, "images"))
         self.set_icon_from_file(path.join(basepath, "images/controku.png"))
 
+        self.worker = CommandWorker()
+        # keys being held, and the devices each one was sent to
+        self.held_keys = {}
+        self.sessions = {}
+        self.active_session = None
+
         con_grid = Gtk.Grid()
         rem_grid = Gtk.Grid()
-        rem_grid.connect("key-press-event", self.keypress)
+        remote_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        remote_box.connect("key-press-event", self.keypress)
+        remote_box.connect("key-release-event", self.keyrelease)
+        self.connect("focus-out-event", self.release_keys)
+
+        # one tab per open session, each with a checkbox to include it in "send to all selected"
+        self.session_bar = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        self.broadcast = Gtk.CheckButton.new_with_label("Send to all selected")
+        if device_ip == "":
+            remote_box.pack_start(self.session_bar, False, False, 0)
+            remote_box.pack_start(self.broadcast, False, False, 0)
+        remote_box.pack_start(rem_grid, True, True, 0)
+
         if device_ip == "":
             vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
             self.add(vbox)
@@ -51,7 +203,7 @@ class Window(Gtk.Window):
             stack.set_transition_duration(420)
 
             stack.add_titled(con_grid, "connection", "Connection")
-            stack.add_titled(rem_grid, "remote", "Remote")
+            stack.add_titled(remote_box, "remote", "Remote")
 
             stack_switcher = Gtk.StackSwitcher()
             stack_switcher.set_stack(stack)
@@ -59,7 +211,7 @@ class Window(Gtk.Window):
             vbox.pack_start(stack_switcher, True, True, 0)
             vbox.pack_start(stack, True, True, 0)
         else:
-            self.add(rem_grid)
+            self.add(remote_box)
 
         button = Gtk.Button.new_from_icon_name("input-keyboard-symbolic", 4)
         button.connect("clicked", self.keyboard)
@@ -132,10 +284,18 @@ class Window(Gtk.Window):
         combo = Gtk.ComboBoxText()
         combo.set_entry_text_column(0)
         con_grid.attach(combo, 0, 1, 2, 1)
-        for device in cached_devices:
-            combo.append(device['ip'], device['name'])
+        for device in registry:
+            combo.append(device['key'], device['name'] or device['ip'] or device['previous_ips'][-1])
         combo.set_active(0)
 
+        # pick up devices as they announce themselves, without searching
+        self.listener = DeviceListener()
+        self.listener.subscribe(lambda event, device: GLib.idle_add(self.device_event, combo, event, device))
+        try:
+            self.listener.start()
+        except OSError as e:
+            print(f"Couldn't listen for device announcements: {e}", file=sys.stderr)
+
         button = Gtk.Button.new_with_label("Search for Devices")
         button.connect("clicked", self.discover_devices, combo)
         con_grid.attach(button, 0, 0, 2, 1)
@@ -149,38 +309,49 @@ class Window(Gtk.Window):
 
         label2 = Gtk.Label()
         con_grid.attach(label2, 1, 3, 2, 4)
+        self.info_labels = (label1, label2)
 
         button = Gtk.Button.new_with_label("Connect")
-        button.connect("clicked", self.connect_device, combo, label1, label2)
+        button.connect("clicked", self.connect_device, combo)
         con_grid.attach(button, 2, 1, 1, 1)
 
+    def targets(self):
+        # every selected session in "send to all selected" mode, otherwise the active device
+        if self.broadcast.get_active():
+            ips = [session.ip for session in self.sessions.values() if session.check.get_active()]
+            if ips:
+                return ips
+
+        return [device_ip] if device_ip != "" else []
+
+    def no_connection(self):
+        dialog = Dialog(self)
+        dialog.run()
+        dialog.destroy()
+
     def send_button(self, button, value):
-        global device_ip
-        if device_ip == "":
-            dialog = Dialog(self)
-            dialog.run()
-            dialog.destroy()
+        ips = self.targets()
+        if not ips:
+            self.no_connection()
             return
 
-        controku.send_key(device_ip, value)
-        print("Sent " + value)
+        # each device has its own worker queue, so they're all sent to at once
+        for ip in ips:
+            self.worker.submit(ip, controku.send_key, ip, value, callback=lambda result, ip=ip: print(f"Sent {value} to {ip}"))
 
     def power(self, button):
-        global device_ip
-        if device_ip == "":
-            dialog = Dialog(self)
-            dialog.run()
-            dialog.destroy()
+        ips = self.targets()
+        if not ips:
+            self.no_connection()
             return
 
-        controku.toggle_power(device_ip)
+        for ip in ips:
+            self.worker.submit(ip, controku.toggle_power, ip)
 
     def keyboard(self, button):
         global device_ip
         if device_ip == "":
-            dialog = Dialog(self)
-            dialog.run()
-            dialog.destroy()
+            self.no_connection()
             return
 
         keyboard = Keyboard(self)
@@ -189,119 +360,244 @@ class Window(Gtk.Window):
         keyboard.destroy()
 
     def keypress(self, widget, key):
-        match key.keyval:
-            case 65288:
-                value = "Back"
-            case 98:
-                value = "Back"
-            case 65307:
-                value = "Home"
-            case 104:
-                value = "Home"
-            case 105:
-                value = "Info"
-            case 65361:
-                value = "Left"
-            case 97:
-                value = "Left"
-            case 65362:
-                value = "Up"
-            case 119:
-                value = "Up"
-            case 65363:
-                value = "Right"
-            case 100:
-                value = "Right"
-            case 65364:
-                value = "Down"
-            case 115:
-                value = "Down"
-            case 65293:
-                value = "Select"
-            case 32:
-                value = "Select"
-            case 111:
-                value = "Select"
-            case 114:
-                value = "Rev"
-            case 44:
-                value = "Rev"
-            case 102:
-                value = "Fwd"
-            case 46:
-                value = "Fwd"
-            case 112:
-                value = "Play"
-            case 47:
-                value = "Play"
-            case 109:
-                value = "VolumeMute"
-            case 92:
-                value = "VolumeMute"
-            case 91:
-                value = "VolumeDown"
-            case 45:
-                value = "VolumeDown"
-            case 93:
-                value = "VolumeUp"
-            case 61:
-                value = "VolumeUp"
-            case 43:
-                value = "VolumeUp"
-
-        self.send_button(self, value)
+        value = remote_key(key.keyval)
+        if value is None:
+            return
+
+        # GTK repeats key-press-event while a key is held, without releasing it in
+        # between; a held key costs a keydown and a keyup, and repeats only renew it
+        ips = self.held_keys.get(key.keyval)
+        if ips is not None:
+            for ip in ips:
+                self.worker.submit(ip, controku.hold_key, ip, value, coalesce=True)
+            return
+
+        ips = self.targets()
+        if not ips:
+            self.no_connection()
+            return
+
+        self.held_keys[key.keyval] = ips
+        for ip in ips:
+            self.worker.submit(ip, controku.hold_key, ip, value, callback=lambda result, ip=ip: print(f"Holding {value} on {ip}"))
+
+    def keyrelease(self, widget, key):
+        self.release_button(key.keyval)
+
+    def release_keys(self, widget, event):
+        # key-release-event never arrives for keys still held when the window loses focus
+        for keyval in list(self.held_keys):
+            self.release_button(keyval)
+
+    def release_button(self, keyval):
+        ips = self.held_keys.pop(keyval, None)
+        if ips is None:
+            return
+
+        value = remote_key(keyval)
+        for ip in ips:
+            self.worker.submit(ip, controku.release_key, ip, value, callback=lambda result, ip=ip: print(f"Released {value} on {ip}"))
 
     def discover_devices(self, button, combo):
-        global cached_devices
-        global cache_path
+        button.set_sensitive(False)
+        self.worker.submit("discovery", self.search_devices, button, combo)
 
-        devices = controku.discover_devices()
-        for device in devices:
-            print(f"Found {device['name']} at {device['ip']}")
-            if device not in cached_devices:
-                cached_devices.append(device)
-                combo.append(device['ip'], device['name'])
+    def search_devices(self, button, combo):
+        # runs on the worker thread; each device is added to the list as soon as it's found
+        try:
+            for device in controku.iter_devices():
+                GLib.idle_add(self.add_device, combo, device)
+        finally:
+            # the worker reports a failed search, but the button has to come back either way
+            GLib.idle_add(self.save_devices, button, combo)
+
+    def remember_device(self, combo, device):
+        global registry
+
+        # a device added by hand or by an older version is keyed by its address
+        # until its UDN is known, so its row in the list has to follow the new key
+        entry, new, moved, replaced = registry.remember(device)
+        if new:
+            combo.append(entry['key'], entry['name'] or entry['ip'])
+        elif replaced is not None:
+            self.rekey_row(combo, replaced, entry)
+
+        return entry, new, moved
+
+    def rekey_row(self, combo, key, entry):
+        ids = [row[combo.get_id_column()] for row in combo.get_model()]
+        if key in ids:
+            position = ids.index(key)
+            active = combo.get_active() == position
+            combo.remove(position)
+            if entry['key'] in ids:
+                # the device already has a row of its own, so the old one was a duplicate
+                if active:
+                    combo.set_active_id(entry['key'])
+            else:
+                combo.insert(position, entry['key'], entry['name'] or entry['ip'])
+                if active:
+                    combo.set_active(position)
+
+        session = self.sessions.get(key)
+        if session is None:
+            return
+
+        if entry['key'] in self.sessions:
+            # the device already has a tab of its own
+            self.close_session(None, session)
+        else:
+            del self.sessions[key]
+            session.key = entry['key']
+            self.sessions[entry['key']] = session
 
+    def add_device(self, combo, device):
+        print(f"Found {device['name']} at {device['ip']}")
+        entry, new, moved = self.remember_device(combo, device)
+        if moved is not None:
+            print(f"{entry['name']} moved from {moved} to {entry['ip']}")
+
+    def device_event(self, combo, event, device):
+        global registry
+
+        if event == "remove":
+            print(f"{device['name']} left the network")
+            return
+
+        self.add_device(combo, device)
+        if combo.get_active() == -1:
+            combo.set_active(0)
+        registry.save()
+
+    def save_devices(self, button, combo):
+        global registry
+
+        button.set_sensitive(True)
         combo.set_active(0)
-        with open(path.join(cache_path, "devices.json"), "w") as file:
-            dump(cached_devices, file)
+        registry.save()
 
     def remove_device(self, button, combo):
-        global cached_devices
-        global cache_path
+        global registry
 
-        for i in range(len(cached_devices)):
-            if cached_devices[i]['name'] == combo.get_active_text() and cached_devices[i]['ip'] == combo.get_active_id():
-                del cached_devices[i]
-                print(f"Removed {combo.get_active_text()} from list")
-                break
-        with open(path.join(cache_path, "devices.json"), "w") as file:
-            dump(cached_devices, file)
+        entry = registry.remove(combo.get_active_id())
+        if entry is not None:
+            print(f"Removed {combo.get_active_text()} from list")
+            session = self.sessions.get(entry['key'])
+            if session is not None:
+                self.close_session(None, session)
+        registry.save()
 
         combo.remove(combo.get_active())
         combo.set_active(0)
 
-    def connect_device(self, button, combo, label1, label2):
+    def connect_device(self, button, combo):
+        global registry
+
+        entry = registry.get(combo.get_active_id())
+        if entry is None:
+            return
+
+        session = self.sessions.get(entry['key'])
+        if session is not None:
+            # already open, so there's nothing to fetch
+            self.switch_session(session)
+            return
+
+        if entry['ip'] is None:
+            print(f"Another device took the address of {entry['name']}; search for devices to find it again", file=sys.stderr)
+            return
+
+        # connecting by hand tries the device again even if it was known to be down
+        controku.circuit_breaker.reset(entry['ip'])
+        self.worker.submit(entry['ip'], controku.get_device, entry['ip'], callback=lambda info: self.show_device(info, combo))
+
+    def show_device(self, info, combo):
+        global registry
+
+        # another device may have been picked while this one was connecting, so
+        # rows are updated by what the registry replaced, not by the active one
+        entry, new, moved = self.remember_device(combo, info)
+        registry.save()
+
+        print(f"Connected to {info['name']} ({info['ip']})")
+        session = self.sessions.get(entry['key'])
+        if session is None:
+            session = self.open_session(entry['key'], info)
+        else:
+            session.info = info
+        self.switch_session(session)
+
+    def open_session(self, key, info):
+        session = Session(key, info)
+        others = [other.radio for other in self.sessions.values()]
+        session.radio = Gtk.RadioButton.new_with_label_from_widget(others[0] if others else None, info['name'] or info['ip'])
+        session.radio.set_mode(False)
+        session.radio.connect("toggled", self.session_toggled, session)
+        session.check = Gtk.CheckButton()
+        session.check.set_tooltip_text("Include in \"Send to all selected\"")
+
+        button = Gtk.Button.new_from_icon_name("window-close-symbolic", 1)
+        button.set_relief(Gtk.ReliefStyle.NONE)
+        button.connect("clicked", self.close_session, session)
+
+        session.box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=2)
+        session.box.pack_start(session.check, False, False, 0)
+        session.box.pack_start(session.radio, False, False, 0)
+        session.box.pack_start(button, False, False, 0)
+        self.session_bar.pack_start(session.box, False, False, 0)
+        session.box.show_all()
+
+        self.sessions[key] = session
+        return session
+
+    def session_toggled(self, radio, session):
+        if radio.get_active():
+            self.switch_session(session)
+
+    def switch_session(self, session):
+        global device_ip
+
+        device_ip = session.ip
+        self.active_session = session
+        session.radio.set_active(True)
+        self.show_info(session.info)
+
+    def close_session(self, button, session):
         global device_ip
-        device_ip = combo.get_active_id()
 
-        info = controku.get_device(device_ip)
+        del self.sessions[session.key]
+        session.box.destroy()
+        if self.active_session is not session:
+            return
+
+        self.active_session = None
+        if self.sessions:
+            self.switch_session(next(iter(self.sessions.values())))
+        else:
+            device_ip = ""
+            for label in self.info_labels:
+                label.set_markup("")
+
+    def show_info(self, info):
+        label1, label2 = self.info_labels
+
         list = {}
         list['Name'] = info['name']
         list['IP Address'] = info['ip']
-        print(f"Connected to {info['name']} ({info['ip']})")
         list['Model'] = info['model']
         list['Serial Number'] = info['serial']
         if info['power'] == True:
             list['Power'] = "On"
         elif info['power'] == False:
             list['Power'] = "Off"
+        elif info['power_mode'] is not None:
+            list['Power'] = info['power_mode']
 
         string1 = "\n"
         string2 = "\n"
         for thing in list:
             string1 += f"<b>{thing}:</b>\n"
-            string2 += list[thing] + "\n"
+            string2 += f"{list[thing]}\n"
         label1.set_markup(string1)
         label2.set_markup(string2)
 
@@ -318,24 +614,49 @@ class Dialog(Gtk.Dialog):
         self.show_all()
 
 class Keyboard(Gtk.Dialog):
+    """
+    Types into the device's on-screen keyboard as the entry changes. Edits
+    are buffered and sent from the worker thread, so typing fast or pasting
+    never blocks the UI; each time it catches up, only the keys needed to
+    turn what was already sent into the entry's latest text are sent.
+    """
     def __init__(self, parent):
         super().__init__(title="Roku Keyboard", transient_for=parent, flags=0)
+        self.parent = parent
+        self.ip = device_ip
+        self.text = ""
+        self.sent = ""
 
         entry = Gtk.Entry()
-        entry.connect("key-press-event", self.send_key, parent)
+        entry.connect("changed", self.changed)
+        entry.connect("activate", self.enter)
 
         box = self.get_content_area()
         box.add(entry)
         self.show_all()
 
-    def send_key(self, entry, key, parent):
-        if quote(key.string) == "%08":
-            parent.send_button(parent, "Backspace")
-        elif quote(key.string) == "%0D":
-            parent.send_button(parent, "Enter")
-            self.destroy()
-        elif quote(key.string) != "":
-            parent.send_button(parent, "Lit_" + quote(key.string))
+    def changed(self, entry):
+        self.text = entry.get_text()
+        # one sync catches up with every change made while it was waiting
+        self.parent.worker.submit(self.ip, self.sync, coalesce=True)
+
+    def sync(self):
+        # runs on the worker thread
+        while self.sent != self.text:
+            text = self.text
+            for key in controku.text_keys(text, self.sent):
+                if self.text != text and key != "Backspace":
+                    # the entry changed again, so stop typing stale text
+                    break
+                controku.get_client(self.ip).send_key(key)
+                if key == "Backspace":
+                    self.sent = self.sent[:-1]
+                else:
+                    self.sent += unquote(key[len("Lit_"):])
+
+    def enter(self, entry):
+        self.parent.worker.submit(self.ip, controku.send_key, self.ip, "Enter", callback=lambda result: print("Sent Enter"))
+        self.destroy()
 
 def main():
     window = Window()
@@ -0,0 +1,113 @@
+import json
+import sys
+from bisect import bisect_left
+from threading import Event, Lock, Thread
+from typing import Optional, TextIO
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf"))
+
+def endpoint(path: str) -> str:
+    """
+    Get the endpoint an ECP request path belongs to, so that requests like
+    "/keypress/Home" and "/keypress/Up" are counted together.
+
+    :param path: Path of the request.
+    :type path: str
+
+    :return: The endpoint, e.g. "/keypress" or "/query/device-info".
+    """
+    parts = path.split("?", 1)[0].split("/")
+    if len(parts) > 2 and parts[1] == "query":
+        return f"/query/{parts[2]}"
+
+    return "/" + parts[1] if len(parts) > 1 else path
+
+class Metrics:
+    """
+    Collects the latency, size and outcome of every request made to each
+    Roku device. An instance is a request hook; see :func:`controku.add_request_hook`.
+    """
+    def __init__(self):
+        self._stats = {}
+        self._lock = Lock()
+        self._dump_stop = None
+
+    def __call__(self, ip: str, method: str, path: str, elapsed: float, size: int, error: Optional[Exception]):
+        key = (ip, endpoint(path))
+        milliseconds = elapsed * 1000
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {"count": 0, "errors": 0, "bytes": 0, "total": 0.0, "min": None, "max": 0.0, "histogram": [0] * len(BUCKETS)}
+
+            stats['count'] += 1
+            stats['bytes'] += size
+            stats['total'] += milliseconds
+            stats['max'] = max(stats['max'], milliseconds)
+            stats['min'] = milliseconds if stats['min'] is None else min(stats['min'], milliseconds)
+            stats['histogram'][bisect_left(BUCKETS, milliseconds)] += 1
+            if error is not None:
+                stats['errors'] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Get the statistics collected so far.
+
+        :return: A dict mapping each device's IP address to a dict of its
+                 endpoints. Each endpoint has its request count, error count,
+                 bytes received, and minimum, mean, and maximum latency in
+                 milliseconds, plus a histogram mapping each bucket's upper
+                 bound in milliseconds to its number of requests.
+        """
+        snapshot = {}
+        with self._lock:
+            for (ip, name), stats in self._stats.items():
+                snapshot.setdefault(ip, {})[name] = {
+                    "count": stats['count'],
+                    "errors": stats['errors'],
+                    "bytes": stats['bytes'],
+                    "min": stats['min'],
+                    "mean": stats['total'] / stats['count'],
+                    "max": stats['max'],
+                    "histogram": {str(bound): count for bound, count in zip(BUCKETS, stats['histogram']) if count},
+                }
+
+        return snapshot
+
+    def reset(self):
+        """
+        Forget all statistics collected so far.
+        """
+        with self._lock:
+            self._stats.clear()
+
+    def start_dump(self, interval: float = 60.0, file: TextIO = sys.stderr):
+        """
+        Periodically write a JSON snapshot of the statistics to a file.
+
+        :param interval: Number of seconds between dumps.
+        :type interval: float
+
+        :param file: File to write to. Defaults to standard error.
+        :type file: TextIO
+        """
+        self.stop_dump()
+        stop = self._dump_stop = Event()
+
+        def dump():
+            while not stop.wait(interval):
+                print(json.dumps(self.snapshot()), file=file, flush=True)
+
+        Thread(target=dump, daemon=True).start()
+
+    def stop_dump(self):
+        """
+        Stop the periodic dump started by :meth:`start_dump`.
+        """
+        if self._dump_stop is not None:
+            self._dump_stop.set()
+            self._dump_stop = None
+
+# The collector installed by default on every request
+metrics = Metrics()
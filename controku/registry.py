@@ -0,0 +1,201 @@
+import json
+import os
+from tempfile import NamedTemporaryFile
+from threading import RLock
+from time import time
+from typing import Iterator, Optional
+
+def default_cache_dir() -> str:
+    """
+    Get controku's cache directory, shared by the GUI and the command line.
+
+    :return: The user cache directory from appdirs, or ~/.cache/controku if appdirs isn't installed.
+    """
+    try:
+        from appdirs import user_cache_dir
+        return user_cache_dir("controku", "benthetechguy")
+    except ImportError:
+        return os.path.join(os.path.expanduser("~"), ".cache", "controku")
+
+def default_path() -> str:
+    """
+    Get the path of the registry file shared by the GUI and the command line.
+
+    :return: The path of devices.json in controku's cache directory.
+    """
+    return os.path.join(default_cache_dir(), "devices.json")
+
+class DeviceRegistry:
+    """
+    The Roku devices controku remembers, keyed by UDN so that a device
+    keeps its entry when its IP address changes.
+
+    Each entry is a dict containing the device's key, name, IP address
+    (None once another device has taken it), UDN, serial number, the IP
+    addresses it had before, and when it was last seen as a UNIX timestamp. Devices whose UDN isn't known yet, such as
+    ones added by hand, are keyed by "ip:" followed by their IP address
+    until it is.
+
+    :param path: Path of the registry file. It's read if it exists.
+    :type path: Optional[str]
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = default_path() if path is None else path
+        self._devices = {}
+        self._by_ip = {}
+        self._lock = RLock()
+        self.load()
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __iter__(self) -> Iterator[dict]:
+        with self._lock:
+            return iter(list(self._devices.values()))
+
+    def __contains__(self, key: str):
+        return key in self._devices
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Get a device by its key.
+
+        :return: The device's entry, or None if it isn't known.
+        """
+        return self._devices.get(key)
+
+    def find_ip(self, ip: str) -> Optional[dict]:
+        """
+        Get the device currently at an IP address.
+
+        :return: The device's entry, or None if no known device has that address.
+        """
+        key = self._by_ip.get(ip)
+        return None if key is None else self._devices[key]
+
+    def load(self):
+        """
+        Read the registry file, replacing the devices in memory. The plain
+        list of name and IP address pairs written by older versions of
+        controku is also accepted.
+        """
+        with self._lock:
+            self._devices.clear()
+            self._by_ip.clear()
+            if not os.path.isfile(self.path):
+                return
+
+            with open(self.path) as file:
+                data = json.load(file)
+
+            if isinstance(data, list):
+                for device in data:
+                    self.remember(device, seen=False)
+            else:
+                for key, device in data.get("devices", {}).items():
+                    self._devices[key] = device
+                    if device['ip'] is not None:
+                        self._by_ip[device['ip']] = key
+
+    def save(self):
+        """
+        Write the registry file. The file is replaced atomically, so it's
+        never left half-written.
+        """
+        with self._lock:
+            data = {"version": 1, "devices": self._devices}
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            with NamedTemporaryFile("w", dir=directory, prefix=".devices-", suffix=".json", delete=False) as file:
+                json.dump(data, file, indent=1)
+            os.replace(file.name, self.path)
+
+    def remember(self, device: dict, seen: bool = True) -> tuple:
+        """
+        Add a device or update its entry, as returned by :func:`controku.get_device`
+        or :func:`controku.discover_devices`.
+
+        :param device: A dict containing at least the device's IP address,
+                       and ideally its name and UDN.
+        :type device: dict
+
+        :param seen: Whether to set the device's last seen time to now.
+        :type seen: bool
+
+        :return: A tuple of the device's entry, whether it is new, its
+                 previous IP address if it changed, otherwise None, and the
+                 key of the address-keyed entry it replaced, otherwise None.
+        """
+        ip = device['ip']
+        udn = device.get('udn')
+        with self._lock:
+            key = udn if udn in self._devices else None
+            replaced = None
+            candidate = self._by_ip.get(ip)
+            if candidate is not None and candidate != key and self._devices[candidate]['udn'] is None:
+                # the entry at this address was added without a UDN, so it's this device
+                if key is None:
+                    key = candidate
+                else:
+                    # which is also known by its UDN, so the address-keyed entry is a duplicate
+                    duplicate = self._devices.pop(candidate)
+                    del self._by_ip[ip]
+                    self._devices[key]['name'] = self._devices[key]['name'] or duplicate['name']
+                    replaced = candidate
+
+            new = key is None
+            if new:
+                key = udn if udn is not None else f"ip:{ip}"
+                self._devices[key] = {"key": key, "name": None, "ip": ip, "udn": None, "serial": None, "previous_ips": [], "last_seen": None}
+            elif udn is not None and key != udn:
+                # the device's UDN is now known, so rekey its entry
+                self._devices[udn] = self._devices.pop(key)
+                if self._by_ip.get(self._devices[udn]['ip']) == key:
+                    self._by_ip[self._devices[udn]['ip']] = udn
+                replaced = key
+                key = udn
+
+            entry = self._devices[key]
+            moved = None
+            if entry['ip'] != ip:
+                moved = entry['ip']
+                if self._by_ip.get(moved) == key:
+                    del self._by_ip[moved]
+                if moved is not None and moved not in entry['previous_ips']:
+                    # None if it was displaced, in which case it's already in previous_ips
+                    entry['previous_ips'].append(moved)
+                entry['ip'] = ip
+
+            other = self._by_ip.get(ip)
+            if other is not None and other != key:
+                # another device had this address, so where that one is now isn't known
+                displaced = self._devices[other]
+                if ip not in displaced['previous_ips']:
+                    displaced['previous_ips'].append(ip)
+                displaced['ip'] = None
+            self._by_ip[ip] = key
+
+            entry['key'] = key
+            entry['udn'] = udn or entry['udn']
+            entry['name'] = device.get('name') or entry['name']
+            entry['serial'] = device.get('serial') or entry['serial']
+            if seen:
+                entry['last_seen'] = time()
+
+            return entry, new, moved, replaced
+
+    def remove(self, key: str) -> Optional[dict]:
+        """
+        Forget a device.
+
+        :param key: The device's key.
+        :type key: str
+
+        :return: The device's entry, or None if it wasn't known.
+        """
+        with self._lock:
+            entry = self._devices.pop(key, None)
+            if entry is not None and self._by_ip.get(entry['ip']) == key:
+                del self._by_ip[entry['ip']]
+
+            return entry
@@ -0,0 +1,447 @@
+"""
+Simulated Roku devices for testing and benchmarking controku without hardware.
+
+Each FakeRoku serves the External Control Protocol on port 8060 of its own
+loopback address (127.0.0.0/8 is all loopback on Linux; other systems need
+the addresses added as aliases first), so the library talks to it exactly
+like a real device. An SSDPResponder answers roku:ecp searches for any
+number of them, and FakeNetwork runs a whole group of devices in one process.
+"""
+import random
+import socket
+import struct
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Optional
+from urllib.parse import parse_qs, unquote
+from xml.sax.saxutils import escape
+
+def _xml(root: str, fields: dict) -> str:
+    body = "".join(f"<{tag}>{escape(str(value))}</{tag}>" for tag, value in fields.items())
+    return f"<{root}>{body}</{root}>"
+
+def _bool(value: bool) -> str:
+    return "true" if value else "false"
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.device._handle(self, "GET")
+
+    def do_POST(self):
+        self.server.device._handle(self, "POST")
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients closing keep-alive connections are expected, not errors
+        pass
+
+class FakeRoku:
+    """
+    A simulated Roku device.
+
+    :param ip: Loopback address to serve on.
+    :type ip: str
+
+    :param name: User-set name of the device.
+    :type name: str
+
+    :param serial: Serial number of the device, also used for its UDN.
+    :type serial: Optional[str]
+
+    :param tv: Whether the device is a Roku TV.
+    :type tv: bool
+
+    :param power: Whether the device starts powered on.
+    :type power: bool
+
+    :param channels: Number of live TV channels in the device's lineup.
+    :type channels: int
+
+    :param latency: Number of seconds to wait before answering each request.
+    :type latency: float
+
+    :param failure_rate: Fraction of requests, from 0 to 1, answered by
+                         dropping the connection instead.
+    :type failure_rate: float
+
+    :param seed: Seed for the random failures.
+    :type seed: Optional[int]
+    """
+    def __init__(self, ip: str = "127.0.0.1", name: str = "Fake Roku", serial: Optional[str] = None, tv: bool = True, power: bool = True, channels: int = 20, latency: float = 0.0, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.ip = ip
+        self.name = name
+        self.serial = serial or "FAKE" + "".join(f"{int(part):03d}" for part in ip.split("."))
+        self.udn = f"29780000-0000-1000-8000-{self.serial[-12:].rjust(12, '0').lower()}"
+        self.tv = tv
+        self.power = power
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.booted = monotonic()
+
+        self.channels = [{"number": f"{i // 4 + 2}.{i % 4 + 1}", "name": f"CH{i:03d}", "type": "air-digital", "physical-channel": str(i // 4 + 14), "user-hidden": "false", "user-favorite": "false"} for i in range(channels)]
+        self.active_channel = 0
+        # State of the media player: its state, the app playing, and the position and duration in milliseconds
+        self.player = {"state": "close", "app": None, "position": 0, "duration": 0}
+
+        self.apps = [
+            {"id": "12", "name": "Netflix", "type": "appl", "version": "5.2.1"},
+            {"id": "837", "name": "YouTube", "type": "appl", "version": "2.21.4"},
+            {"id": "tvinput.dtv", "name": "Live TV", "type": "tvin", "version": "1.0.0"},
+        ]
+        # ID of the app in the foreground, or None for the home screen
+        self.active_app = None
+
+        # Every request received, as (method, path) tuples
+        self.requests = []
+        # Every key received through /keypress/
+        self.keys = []
+        # Keys that are currently held down with /keydown/
+        self.held = set()
+        # Text typed with Lit_ and Backspace keys
+        self.text = ""
+        self._lock = Lock()
+        self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """
+        Start serving requests on a background thread.
+        """
+        self._server = _Server((self.ip, 8060), _Handler)
+        self._server.device = self
+        Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        """
+        Stop serving requests.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def device_info(self) -> str:
+        """
+        :return: The device's `/query/device-info` document.
+        """
+        return _xml("device-info", {
+            "udn": self.udn,
+            "serial-number": self.serial,
+            "device-id": self.serial,
+            "vendor-name": "Roku",
+            "model-name": "7000X" if self.tv else "3930X",
+            "friendly-model-name": "Roku TV" if self.tv else "Roku Express",
+            "user-device-name": self.name,
+            "user-device-location": "Test Lab",
+            "is-tv": _bool(self.tv),
+            "is-stick": "false",
+            "ui-resolution": "1080p",
+            "wifi-mac": "d8:31:34:" + ":".join(f"{int(part):02x}" for part in self.ip.split(".")[1:]),
+            "software-version": "11.5.0",
+            "power-mode": "PowerOn" if self.power else "Ready",
+            "uptime": str(int(monotonic() - self.booted)),
+            "developer-enabled": "false",
+            "supports-private-listening": "true",
+            "headphones-connected": "false",
+        })
+
+    def tv_channels(self) -> str:
+        """
+        :return: The device's `/query/tv-channels` document.
+        """
+        return "<tv-channels>" + "".join(_xml("channel", channel) for channel in self.channels) + "</tv-channels>"
+
+    def tv_active_channel(self) -> str:
+        """
+        :return: The device's `/query/tv-active-channel` document.
+        """
+        channel = dict(self.channels[self.active_channel]) if self.channels else {}
+        channel.update({"active-input": _bool(self.power), "signal-state": "valid", "signal-mode": "1080i", "program-title": "Test Pattern", "program-description": "A simulated program.", "program-ratings": "TV-G", "program-has-cc": "true"})
+        return "<tv-channel>" + _xml("channel", channel) + "</tv-channel>"
+
+    def media_player(self) -> str:
+        """
+        :return: The device's `/query/media-player` document.
+        """
+        player = self.player
+        if player['app'] is None:
+            return f'<player error="false" state="{player["state"]}"/>'
+
+        return (
+            f'<player error="false" state="{player["state"]}">'
+            f'<plugin bandwidth="10000000 bps" id="{escape(str(player["app"]))}" name="{escape(str(player["app"]))}"/>'
+            f'<position>{player["position"]} ms</position>'
+            f'<duration>{player["duration"]} ms</duration>'
+            '<is_live>false</is_live>'
+            '</player>'
+        )
+
+    def apps_document(self) -> str:
+        """
+        :return: The device's `/query/apps` document.
+        """
+        apps = "".join(f'<app id="{escape(app["id"])}" type="{app["type"]}" version="{app["version"]}">{escape(app["name"])}</app>' for app in self.apps)
+        return f'<?xml version="1.0" encoding="UTF-8" ?><apps>{apps}</apps>'
+
+    def active_app_document(self) -> str:
+        """
+        :return: The device's `/query/active-app` document.
+        """
+        for app in self.apps:
+            if app['id'] == self.active_app:
+                return f'<?xml version="1.0" encoding="UTF-8" ?><active-app><app id="{escape(app["id"])}" type="{app["type"]}" version="{app["version"]}">{escape(app["name"])}</app></active-app>'
+
+        return '<?xml version="1.0" encoding="UTF-8" ?><active-app><app>Roku</app></active-app>'
+
+    def icon(self, app_id: str) -> Optional[bytes]:
+        """
+        :return: A stand-in for an app's icon, which changes with its version, or None if it isn't installed.
+        """
+        for app in self.apps:
+            if app['id'] == app_id:
+                return b"\x89PNG\r\n\x1a\n" + f"{app['id']} {app['version']}".encode()
+
+        return None
+
+    def _route(self, method: str, path: str) -> Optional[str | bytes]:
+        path, _, query = path.partition("?")
+        if method == "GET":
+            match path:
+                case "/query/device-info":
+                    return self.device_info()
+                case "/query/media-player":
+                    return self.media_player()
+                case "/query/tv-channels" if self.tv:
+                    return self.tv_channels()
+                case "/query/tv-active-channel" if self.tv:
+                    return self.tv_active_channel()
+                case "/query/apps":
+                    return self.apps_document()
+                case "/query/active-app":
+                    return self.active_app_document()
+                case _ if path.startswith("/query/icon/"):
+                    return self.icon(unquote(path[len("/query/icon/"):]))
+        elif path.startswith("/keypress/"):
+            key = path[len("/keypress/"):]
+            self.keys.append(key)
+            match key:
+                case "PowerOn":
+                    self.power = True
+                case "PowerOff":
+                    self.power = False
+                case "Power":
+                    self.power = not self.power
+                case "Backspace":
+                    self.text = self.text[:-1]
+                case _ if key.startswith("Lit_"):
+                    self.text += unquote(key[len("Lit_"):])
+            return ""
+        elif path.startswith("/keydown/"):
+            self.held.add(path[len("/keydown/"):])
+            return ""
+        elif path.startswith("/keyup/"):
+            self.held.discard(path[len("/keyup/"):])
+            return ""
+        elif path == "/launch/tvinput.dtv" and self.tv:
+            number = parse_qs(query).get("ch", [None])[0]
+            for i, channel in enumerate(self.channels):
+                if channel['number'] == number:
+                    self.active_channel = i
+            return ""
+        elif path == "/search/browse":
+            return ""
+        elif path.startswith("/launch/"):
+            app_id = unquote(path[len("/launch/"):])
+            if any(app['id'] == app_id for app in self.apps):
+                self.active_app = app_id
+                return ""
+
+        return None
+
+    def _handle(self, request: BaseHTTPRequestHandler, method: str):
+        with self._lock:
+            self.requests.append((method, request.path))
+            fail = self.failure_rate > 0 and self.random.random() < self.failure_rate
+
+        if self.latency:
+            sleep(self.latency)
+        if fail:
+            request.close_connection = True
+            request.connection.shutdown(socket.SHUT_RDWR)
+            return
+
+        with self._lock:
+            body = self._route(method, request.path)
+
+        if body is None:
+            request.send_response(404)
+            body = ""
+        else:
+            request.send_response(200)
+
+        if isinstance(body, bytes):
+            data = body
+            request.send_header("Content-Type", "image/png")
+        else:
+            data = body.encode()
+            request.send_header("Content-Type", "text/xml; charset=\"utf-8\"")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+class SSDPResponder:
+    """
+    Answers roku:ecp SSDP searches on behalf of simulated devices.
+
+    :param devices: The devices to answer for.
+    :type devices: list
+
+    :param port: UDP port to listen on.
+    :type port: int
+    """
+    def __init__(self, devices: list, port: int = 1900):
+        self.devices = devices
+        self.port = port
+        self._sock = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """
+        Start answering searches on a background thread.
+        """
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("", self.port))
+        self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, struct.pack("4s4s", socket.inet_aton("239.255.255.250"), socket.inet_aton("0.0.0.0")))
+        Thread(target=self._serve, args=(self._sock,), daemon=True).start()
+
+    def stop(self):
+        """
+        Stop answering searches.
+        """
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _serve(self, sock: socket.socket):
+        while True:
+            try:
+                data, address = sock.recvfrom(2048)
+            except OSError:
+                return
+
+            if not data.startswith(b"M-SEARCH") or (b"roku:ecp" not in data and b"ssdp:all" not in data):
+                continue
+
+            for device in self.devices:
+                try:
+                    sock.sendto(self._message(device, "HTTP/1.1 200 OK", "ST"), address)
+                except OSError:
+                    return
+
+    def _message(self, device: FakeRoku, start: str, target: str, nts: Optional[str] = None) -> bytes:
+        return (
+            f"{start}\r\n"
+            "Cache-Control: max-age=3600\r\n"
+            f"{target}: roku:ecp\r\n"
+            + (f"NTS: {nts}\r\nHOST: 239.255.255.250:{self.port}\r\n" if nts else "")
+            + f"USN: uuid:roku:ecp:{device.serial}\r\n"
+            "Ext: \r\n"
+            "Server: Roku/11.5.0 UPnP/1.0 Roku/11.5.0\r\n"
+            f"LOCATION: http://{device.ip}:8060/\r\n"
+            "\r\n"
+        ).encode()
+
+    def announce(self, device: FakeRoku, alive: bool = True):
+        """
+        Multicast a NOTIFY message for a device, the way a real one does
+        when it comes online (ssdp:alive) or leaves (ssdp:byebye).
+
+        :param device: The device to announce.
+        :type device: FakeRoku
+
+        :param alive: Whether to send ssdp:alive rather than ssdp:byebye.
+        :type alive: bool
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        try:
+            sock.sendto(self._message(device, "NOTIFY * HTTP/1.1", "NT", "ssdp:alive" if alive else "ssdp:byebye"), ("239.255.255.250", self.port))
+        finally:
+            sock.close()
+
+class FakeNetwork:
+    """
+    A group of simulated devices with an SSDP responder, all in one process.
+    Devices are numbered from `first`, e.g. 127.0.1.1, 127.0.1.2 and so on.
+
+    :param count: Number of devices.
+    :type count: int
+
+    :param subnet: The first three octets of the devices' loopback addresses.
+    :type subnet: str
+
+    :param first: Last octet of the first device's address.
+    :type first: int
+
+    :param ssdp: Whether to answer SSDP searches.
+    :type ssdp: bool
+
+    Any other arguments are passed on to each FakeRoku.
+    """
+    def __init__(self, count: int, subnet: str = "127.0.1", first: int = 1, ssdp: bool = True, **options):
+        if first + count > 255:
+            raise ValueError("Too many devices for one subnet.")
+
+        self.devices = [FakeRoku(f"{subnet}.{first + i}", name=f"Fake Roku {i + 1}", **options) for i in range(count)]
+        self.responder = SSDPResponder(self.devices) if ssdp else None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def ips(self) -> list:
+        return [device.ip for device in self.devices]
+
+    def start(self):
+        """
+        Start every device, and the SSDP responder if enabled.
+        """
+        for device in self.devices:
+            device.start()
+        if self.responder is not None:
+            self.responder.start()
+
+    def stop(self):
+        """
+        Stop every device and the SSDP responder.
+        """
+        if self.responder is not None:
+            self.responder.stop()
+        for device in self.devices:
+            device.stop()
@@ -0,0 +1,223 @@
+import logging
+from controku.controku import _parse_active_tv_channel, _parse_media_player, add_request_hook, get_client, remove_request_hook
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Callable, Optional
+from xml.etree import ElementTree
+
+_log = logging.getLogger(__name__)
+
+# Seconds of drift between the interpolated and reported playback position that counts as a seek
+SEEK_TOLERANCE = 2.0
+
+class StateWatcher:
+    """
+    Watches a Roku device's state by polling it, and tells subscribers what
+    changed. Polling is adaptive: it's fast right after a command is sent to
+    the device or something changes, and backs off while nothing does.
+    Channel and media player responses that are identical to the previous
+    poll's aren't parsed again.
+
+    The state is a dict containing whether the device is reachable ("online"),
+    its power mode ("power"), its active live TV channel ("channel", TVs
+    only), and the state of its media player ("player"). Subscribers are
+    called with the name of the key that changed, its old value, and its new
+    value, on the watcher's thread. Playback position changes aren't events
+    unless the position jumps, such as when seeking; use :meth:`position`
+    to get the current position, interpolated between polls.
+
+    :param ip: IP address of the device.
+    :type ip: str
+
+    :param min_interval: Seconds between polls right after a change.
+    :type min_interval: float
+
+    :param max_interval: Seconds between polls once the device is idle.
+    :type max_interval: float
+
+    :param backoff: Factor the interval grows by after each poll without changes.
+    :type backoff: float
+
+    :param channel: Whether to watch the active live TV channel.
+    :type channel: bool
+
+    :param player: Whether to watch the media player.
+    :type player: bool
+    """
+    def __init__(self, ip: str, min_interval: float = 0.5, max_interval: float = 10.0, backoff: float = 1.5, channel: bool = True, player: bool = True):
+        self.ip = ip
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.watch_channel = channel
+        self.watch_player = player
+        self.interval = min_interval
+        self.state = {"online": None, "power": None, "channel": None, "player": None}
+        self.polled = None
+        self._bodies = {}
+        self._subscribers = []
+        self._lock = Lock()
+        self._wake = Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def subscribe(self, callback: Callable):
+        """
+        Call a function on every change.
+
+        :param callback: Function taking the name of what changed, its old value, and its new value.
+        :type callback: Callable
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable):
+        """
+        Stop calling a function added with :meth:`subscribe`.
+        """
+        self._subscribers.remove(callback)
+
+    def start(self):
+        """
+        Start polling on a background thread.
+        """
+        if self._thread is not None:
+            return
+
+        add_request_hook(self._request_hook)
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling.
+        """
+        thread = self._thread
+        if thread is None:
+            return
+
+        self._thread = None
+        remove_request_hook(self._request_hook)
+        self._wake.set()
+        thread.join()
+
+    def poke(self):
+        """
+        Poll again now and go back to polling quickly, e.g. after sending the device a command.
+        """
+        self.interval = self.min_interval
+        self._wake.set()
+
+    def position(self) -> Optional[int]:
+        """
+        Get the media player's playback position.
+
+        :return: The position in milliseconds, interpolated from the last
+                 poll while playing, or None if nothing is playing.
+        """
+        with self._lock:
+            player = self.state['player']
+            if player is None or player['position'] is None:
+                return None
+
+            position = player['position']
+            if player['state'] == "play":
+                position += int((monotonic() - self.polled) * 1000)
+            if player['duration']:
+                position = min(position, player['duration'])
+
+            return position
+
+    def _request_hook(self, ip, method, path, elapsed, size, error):
+        # commands sent to the device through controku are likely to change its state
+        if ip == self.ip and method == "POST":
+            self.poke()
+
+    def _emit(self, name: str, old, new):
+        for callback in list(self._subscribers):
+            try:
+                callback(name, old, new)
+            except Exception:
+                _log.exception("Error in state watcher subscriber")
+
+    def _fetch(self, path: str) -> Optional[bytes]:
+        # the body of the response, or None if it's the same as last time
+        body = get_client(self.ip).request("GET", path)
+        if self._bodies.get(path) == body:
+            return None
+
+        self._bodies[path] = body
+        return body
+
+    def _poll(self) -> dict:
+        state = dict(self.state)
+        try:
+            # device-info includes the uptime, so it's different every time and always parsed
+            client = get_client(self.ip)
+            tree = ElementTree.fromstring(client.request("GET", "/query/device-info"))
+            client.cache.put(self.ip, tree)
+            state['power'] = tree.findtext('power-mode')
+            self._is_tv = tree.findtext('is-tv') == "true"
+
+            if self.watch_channel and self._is_tv:
+                body = self._fetch("/query/tv-active-channel")
+                if body is not None:
+                    try:
+                        state['channel'] = _parse_active_tv_channel(ElementTree.fromstring(body))
+                    except IndexError:
+                        # no live TV channel is active
+                        state['channel'] = None
+
+            if self.watch_player:
+                body = self._fetch("/query/media-player")
+                if body is not None:
+                    state['player'] = _parse_media_player(ElementTree.fromstring(body))
+
+            state['online'] = True
+        except (ConnectionError, ElementTree.ParseError):
+            self._bodies.clear()
+            state['online'] = False
+
+        return state
+
+    def _changed(self, old: Optional[dict], new: Optional[dict]) -> bool:
+        # whether the player changed in a way other than playback moving on as expected
+        if old is None or new is None:
+            return old != new
+
+        if {key: value for key, value in old.items() if key != 'position'} != {key: value for key, value in new.items() if key != 'position'}:
+            return True
+
+        expected = self.position()
+        return expected is not None and new['position'] is not None and abs(new['position'] - expected) > SEEK_TOLERANCE * 1000
+
+    def _run(self):
+        self._is_tv = False
+        while self._thread is not None:
+            state = self._poll()
+            changes = []
+            for name in ("online", "power", "channel"):
+                if state[name] != self.state[name]:
+                    changes.append((name, self.state[name], state[name]))
+            if self._changed(self.state['player'], state['player']):
+                changes.append(("player", self.state['player'], state['player']))
+
+            with self._lock:
+                self.state = state
+                self.polled = monotonic()
+
+            for name, old_value, new_value in changes:
+                self._emit(name, old_value, new_value)
+
+            if changes:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
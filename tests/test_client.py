@@ -0,0 +1,40 @@
+import pytest
+import controku
+from controku.testing import FakeRoku
+
+def test_toggle_power_ignores_cached_power_state():
+    with FakeRoku("127.0.20.1", tv=True, power=True) as device:
+        assert controku.get_device(device.ip)['power'] is True
+
+        # turned off with the physical remote, while device-info is still cached
+        device.power = False
+        controku.toggle_power(device.ip)
+
+        assert device.keys[-1] == "PowerOn"
+        assert device.power is True
+
+def test_failing_request_hook_does_not_fail_request(capsys, caplog):
+    def hook(*args):
+        raise RuntimeError("broken hook")
+
+    controku.add_request_hook(hook)
+    try:
+        with FakeRoku("127.0.20.2") as device:
+            controku.send_key(device.ip, "Home")
+            assert device.keys == ["Home"]
+
+        # reported through logging, not into a program's stdout
+        assert capsys.readouterr().out == ""
+        assert "broken hook" in caplog.text
+    finally:
+        controku.remove_request_hook(hook)
+
+def test_discovery_raises_when_search_cannot_be_sent(monkeypatch):
+    from ssdpy import SSDPClient
+
+    def send(self, data):
+        raise OSError("Network is unreachable")
+
+    monkeypatch.setattr(SSDPClient, "send", send)
+    with pytest.raises(OSError, match="unreachable"):
+        controku.discover_devices(timeout=3)
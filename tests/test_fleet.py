@@ -0,0 +1,29 @@
+from controku.fleet import INVENTORY_FIELDS, broadcast, iter_inventory
+from controku.testing import FakeRoku
+from time import monotonic
+
+def test_timed_out_devices_do_not_hold_up_the_others():
+    slow = [FakeRoku(f"127.0.20.{i}", latency=3.0) for i in (3, 4)]
+    fast = [FakeRoku(f"127.0.20.{i}") for i in (5, 6)]
+    for device in slow + fast:
+        device.start()
+    try:
+        began = monotonic()
+        results = broadcast([device.ip for device in slow + fast], "send_key", "Home", concurrency=2, timeout=0.5)
+        elapsed = monotonic() - began
+
+        assert [type(result['error']) for result in results[:2]] == [TimeoutError, TimeoutError]
+        assert [result['error'] for result in results[2:]] == [None, None]
+        assert elapsed < 2.0
+    finally:
+        for device in slow + fast:
+            device.stop()
+
+def test_inventory_records_have_a_stable_schema():
+    with FakeRoku("127.0.20.8") as device:
+        records = {record['ip']: record for record in iter_inventory([device.ip, "127.0.20.9"], timeout=2.0)}
+
+    healthy, unreachable = records[device.ip], records["127.0.20.9"]
+    assert healthy['error'] is None and healthy['serial'] == device.serial
+    assert unreachable['error'] is not None
+    assert list(healthy) == list(unreachable) == INVENTORY_FIELDS
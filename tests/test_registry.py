@@ -0,0 +1,79 @@
+import json
+from controku.registry import DeviceRegistry
+
+def legacy_registry(tmp_path):
+    path = tmp_path / "devices.json"
+    path.write_text(json.dumps([{"name": "Living Room", "ip": "192.168.1.20"}]))
+    return DeviceRegistry(str(path))
+
+def test_legacy_file_is_keyed_by_address(tmp_path):
+    registry = legacy_registry(tmp_path)
+
+    entry = registry.get("ip:192.168.1.20")
+    assert entry['name'] == "Living Room"
+    assert entry['udn'] is None
+    assert registry.find_ip("192.168.1.20") is entry
+
+def test_rediscovered_legacy_device_is_rekeyed(tmp_path):
+    registry = legacy_registry(tmp_path)
+    udn = "29780000-0000-1000-8000-000000000020"
+
+    entry, new, moved, replaced = registry.remember({"name": "Living Room", "ip": "192.168.1.20", "udn": udn})
+
+    assert (entry['key'], new, moved, replaced) == (udn, False, None, "ip:192.168.1.20")
+    assert registry.get("ip:192.168.1.20") is None
+    assert registry.get(udn) is entry
+    assert len(registry) == 1
+
+def test_rekeyed_device_can_be_removed_and_saved(tmp_path):
+    registry = legacy_registry(tmp_path)
+    udn = "29780000-0000-1000-8000-000000000020"
+    registry.remember({"name": "Living Room", "ip": "192.168.1.20", "udn": udn})
+    registry.save()
+
+    reloaded = DeviceRegistry(registry.path)
+    assert reloaded.get(udn)['ip'] == "192.168.1.20"
+
+    reloaded.remove(udn)
+    reloaded.save()
+    assert len(DeviceRegistry(registry.path)) == 0
+
+def test_legacy_entry_of_a_known_device_is_merged(tmp_path):
+    registry = legacy_registry(tmp_path)
+    udn = "29780000-0000-1000-8000-000000000020"
+    registry.remember({"name": None, "ip": "192.168.1.30", "udn": udn})
+
+    # the legacy address turns out to belong to the device already known by its UDN
+    entry, new, moved, replaced = registry.remember({"name": None, "ip": "192.168.1.20", "udn": udn})
+
+    assert (entry['key'], new, moved, replaced) == (udn, False, "192.168.1.30", "ip:192.168.1.20")
+    assert entry['name'] == "Living Room"
+    assert registry.get("ip:192.168.1.20") is None
+    assert len(registry) == 1
+
+def test_known_device_moving_onto_another_known_devices_address(tmp_path):
+    registry = DeviceRegistry(str(tmp_path / "devices.json"))
+    registry.remember({"name": "A", "ip": "10.0.0.5", "udn": "a"})
+    registry.remember({"name": "B", "ip": "10.0.0.9", "udn": "b"})
+
+    entry, new, moved, replaced = registry.remember({"name": "B", "ip": "10.0.0.5", "udn": "b"})
+
+    # B took A's address, but A is a different device, so it keeps its own entry
+    assert (entry['key'], new, moved, replaced) == ("b", False, "10.0.0.9", None)
+    assert registry.get("a")['name'] == "A"
+    assert registry.find_ip("10.0.0.5") is entry
+    assert len(registry) == 2
+
+    # and A's address isn't known anymore, so it can't be mistaken for B's
+    displaced = registry.get("a")
+    assert displaced['ip'] is None
+    assert displaced['previous_ips'] == ["10.0.0.5"]
+
+    registry.save()
+    reloaded = DeviceRegistry(registry.path)
+    assert reloaded.get("a")['ip'] is None
+    assert reloaded.find_ip("10.0.0.5")['key'] == "b"
+
+    # until A is found again
+    entry, new, moved, replaced = reloaded.remember({"name": "A", "ip": "10.0.0.7", "udn": "a"})
+    assert (entry['ip'], moved, entry['previous_ips']) == ("10.0.0.7", None, ["10.0.0.5"])